@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+
+import numpy as np
+
+from . import hist_arrays
+from . import rootfile_index
+from . import shape_cache
+from .histogram_cache import histogram_cache
+from .rootfile_pool import read_lock, rootfile_pool
+
+logger = logging.getLogger(__name__)
+
+# Readers used by the parsers to access the histograms of a file. All provide the
+# key index of the file, ROOT histograms via get and NumPy arrays via arrays. The
+# uproot and cache backends read the arrays without importing ROOT, ROOT
+# histograms are only created (and ROOT imported) when get is called, e.g. to plot
+# them.
+
+
+class RootBackend(object):
+    name = "root"
+
+    def __init__(self, filename, sidecar_index=False):
+        self._filename = filename
+        self._rootfile = rootfile_pool.acquire(filename)
+        self._file_key = rootfile_index.file_identity(filename)
+        self._sidecar_index = sidecar_index
+        self._index = None
+
+    @property
+    def filename(self):
+        return self._filename
+
+    # identity of the file used in the keys of the histogram cache
+    @property
+    def file_key(self):
+        return self._file_key
+
+    @property
+    def rootfile(self):
+        return self._rootfile
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = rootfile_index.get_index(
+                self._rootfile, self._filename, self._sidecar_index
+            )
+        return self._index
+
+    def key_titles(self):
+        return [key.GetTitle() for key in self._rootfile.GetListOfKeys()]
+
+    # returns the cached histogram, or the null pointer of ROOT for missing keys
+    def get(self, path):
+        return histogram_cache.get_or_read(self._rootfile, self._file_key, path)
+
+    # the histogram may be evicted from the cache and freed while the caller still
+    # holds the arrays, so they are copied from its buffers
+    def arrays(self, path):
+        hist = self.get(path)
+        if not hist:
+            logger.fatal("Cannot read %s from %s!" % (path, self._filename))
+            raise Exception
+        return hist_arrays.copy(hist_arrays.to_arrays(hist))
+
+    # reads the object without caching it, the result is passed to to_root and
+    # to_arrays
+    def load(self, path):
+        import ROOT
+
+        with read_lock:
+            hist = self._rootfile.Get(path)
+        if not hist:
+            logger.fatal("Cannot read %s from %s!" % (path, self._filename))
+            raise Exception
+        if hist.InheritsFrom("TH1"):
+            hist.SetDirectory(0)
+        ROOT.SetOwnership(hist, True)
+        return hist
+
+    def to_root(self, hist):
+        return hist
+
+    def is_histogram(self, hist):
+        return hist.InheritsFrom("TH1") and hist.GetDimension() == 1
+
+    def title(self, hist):
+        return hist.GetTitle()
+
+    # the arrays are views on the histogram buffers
+    def to_arrays(self, hist):
+        return hist_arrays.to_arrays(hist)
+
+    def enable_threads(self):
+        import ROOT
+
+        ROOT.EnableThreadSafety()
+
+    def close(self):
+        logger.debug("Releasing rootfile %s" % (self._filename))
+        rootfile_pool.release(self._filename)
+
+
+class UprootBackend(object):
+    name = "uproot"
+
+    def __init__(self, filename, sidecar_index=False):
+        import uproot
+
+        self._filename = filename
+        self._file = uproot.open(filename)
+        self._file_key = rootfile_index.file_identity(filename)
+        self._sidecar_index = sidecar_index
+        self._index = None
+
+    @property
+    def filename(self):
+        return self._filename
+
+    # identity of the file used in the keys of the histogram cache
+    @property
+    def file_key(self):
+        return self._file_key
+
+    @property
+    def rootfile(self):
+        return self._file
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = rootfile_index.get_index(
+                self._file, self._filename, self._sidecar_index
+            )
+        return self._index
+
+    def key_titles(self):
+        return [
+            self._file.key(name).title()
+            for name in self._file.keys(recursive=False, cycle=False)
+        ]
+
+    # converts the histogram to ROOT on first request, which is then cached like
+    # the histograms read by the ROOT backend. Returns None for missing keys.
+    def get(self, path):
+        key = (self._file_key, path)
+        hist = histogram_cache.get(key)
+        if hist is None:
+            directory, _, name = path.rpartition("/")
+            if not self.index.contains(directory, name):
+                return None
+            hist = self.to_root(self.load(path))
+            histogram_cache.put(key, hist)
+        return hist
+
+    def arrays(self, path):
+        return self.to_arrays(self.load(path))
+
+    def load(self, path):
+        try:
+            return self._file[path]
+        except KeyError:
+            logger.fatal("Cannot read %s from %s!" % (path, self._filename))
+            raise Exception
+
+    def to_root(self, hist):
+        import ROOT
+        import uproot.pyroot
+
+        converted = uproot.pyroot.to_pyroot(hist)
+        if converted.InheritsFrom("TH1"):
+            converted.SetDirectory(0)
+        ROOT.SetOwnership(converted, True)
+        return converted
+
+    def is_histogram(self, hist):
+        return hist.classname.startswith("TH1")
+
+    def title(self, hist):
+        return hist.member("fTitle")
+
+    def to_arrays(self, hist):
+        values = hist.values(flow=True)
+        # like ROOT, the errors are taken from the contents if no squared weights
+        # are stored
+        errors = np.sqrt(np.abs(hist.variances(flow=True)[1:-1]))
+        return hist_arrays.HistArrays(
+            edges=hist.axis().edges(flow=False),
+            contents=values[1:-1],
+            errors_up=errors,
+            errors_down=errors,
+            underflow=values[0],
+            overflow=values[-1],
+        )
+
+    def enable_threads(self):
+        pass
+
+    def close(self):
+        self._file.close()
+
+
+# reads the columnar shape cache of the file (see shape_cache.py), which is
+# exported with the root backend on first use and whenever the file changes
+class ShapeCacheBackend(object):
+    name = "cache"
+
+    def __init__(self, filename, sidecar_index=False):
+        self._filename = filename
+        self._file_key = rootfile_index.file_identity(filename)
+        self._cache = shape_cache.open_cache(filename)
+        self._index = rootfile_index.Rootfile_index(
+            None, filename, directories=self._cache.directories
+        )
+
+    @property
+    def filename(self):
+        return self._filename
+
+    # identity of the file used in the keys of the histogram cache
+    @property
+    def file_key(self):
+        return self._file_key
+
+    @property
+    def rootfile(self):
+        return self._cache
+
+    @property
+    def index(self):
+        return self._index
+
+    def key_titles(self):
+        return list(self._cache.titles)
+
+    # same as for the uproot backend, ROOT histograms are created on request
+    def get(self, path):
+        key = (self._file_key, path)
+        hist = histogram_cache.get(key)
+        if hist is None:
+            if not self._cache.contains(path):
+                return None
+            hist = self.to_root(self.load(path))
+            histogram_cache.put(key, hist)
+        return hist
+
+    def arrays(self, path):
+        return self._cache.arrays(path)
+
+    def load(self, path):
+        return self._cache.load(path)
+
+    def to_root(self, shape):
+        return shape_cache.to_root(shape)
+
+    def to_arrays(self, shape):
+        return shape.arrays
+
+    def is_histogram(self, shape):
+        return True
+
+    def title(self, shape):
+        return shape.title
+
+    def enable_threads(self):
+        pass
+
+    def close(self):
+        self._cache.close()
+
+
+backends = {"root": RootBackend, "uproot": UprootBackend, "cache": ShapeCacheBackend}
+
+
+# returns the backend for the file. The backend is given by name, by default the
+# one set in the environment variable DUMBLEDRAW_BACKEND or root.
+def open_backend(filename, backend=None, sidecar_index=False):
+    if backend is None:
+        backend = os.environ.get("DUMBLEDRAW_BACKEND", "root")
+    if not backend in backends:
+        logger.fatal(
+            "Unknown backend %s, choose one of %s!" % (backend, list(backends.keys()))
+        )
+        raise Exception
+    return backends[backend](filename, sidecar_index)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import collections
+import logging
+import multiprocessing
+import time
+import traceback
+
+from . import profiling
+
+logger = logging.getLogger(__name__)
+
+# profile holds the profiled stages and events of the plot if profiling is enabled
+BatchResult = collections.namedtuple(
+    "BatchResult",
+    ["index", "name", "outputs", "wall_time", "error", "profile"],
+    defaults=(None,),
+)
+
+
+# sets up the ROOT state of a fresh worker process once
+def _init_worker(style, style_kwargs, log_level):
+    import ROOT as R
+    from . import styles
+
+    logging.basicConfig(level=log_level)
+    R.gROOT.SetBatch(True)
+    styles.SetStyle(style, **style_kwargs)
+
+
+def _run_spec(task):
+    index, plot_function, spec, profile = task
+    name = spec.get("name", str(index))
+    start = time.time()
+    profiler = profiling.Profiler() if profile else None
+    try:
+        if profiler is None:
+            outputs = plot_function(**spec)
+        else:
+            with profiling.profile(profiler):
+                outputs = plot_function(**spec)
+        error = None
+    except Exception:
+        outputs = None
+        error = traceback.format_exc()
+    return BatchResult(
+        index,
+        name,
+        outputs,
+        time.time() - start,
+        error,
+        None if profiler is None else profiler.to_dict(),
+    )
+
+
+# Renders many plots in parallel. plot_function is called once per spec with the
+# items of the spec dictionary as keyword arguments and is expected to create,
+# draw and save a single Plot. It has to be defined at module level so that it
+# can be sent to the worker processes. Failures do not stop the batch, they are
+# returned together with the per-plot wall time in a list of BatchResult ordered
+# like the specs. With profile=True the stages of every plot are profiled, see
+# profiling.merge and profiling.write_chrome_trace to combine the profiles.
+def run_batch(
+    plot_function,
+    specs,
+    nprocesses=None,
+    style="none",
+    style_kwargs=None,
+    start_method="spawn",
+    maxtasksperchild=None,
+    profile=False,
+):
+    style_kwargs = {} if style_kwargs is None else style_kwargs
+    tasks = [(index, plot_function, spec, profile) for index, spec in enumerate(specs)]
+    nprocesses = multiprocessing.cpu_count() if nprocesses is None else nprocesses
+    nprocesses = max(1, min(nprocesses, len(tasks)))
+    initargs = (style, style_kwargs, logging.getLogger().getEffectiveLevel())
+    start = time.time()
+    results = []
+    if nprocesses == 1:
+        _init_worker(*initargs)
+        for task in tasks:
+            results.append(_run_spec(task))
+            _log_result(results[-1], len(tasks))
+    else:
+        context = multiprocessing.get_context(start_method)
+        pool = context.Pool(
+            nprocesses,
+            initializer=_init_worker,
+            initargs=initargs,
+            maxtasksperchild=maxtasksperchild,
+        )
+        try:
+            for result in pool.imap_unordered(_run_spec, tasks):
+                results.append(result)
+                _log_result(result, len(tasks))
+        finally:
+            pool.close()
+            pool.join()
+    results.sort(key=lambda result: result.index)
+    failures = [result for result in results if result.error is not None]
+    logger.info(
+        "Rendered %d plots in %.1f s using %d processes, %d failed"
+        % (len(results), time.time() - start, nprocesses, len(failures))
+    )
+    return results
+
+
+def _log_result(result, ntasks):
+    if result.error is None:
+        logger.info(
+            "[%d/%d] Created plot %s in %.2f s"
+            % (result.index + 1, ntasks, result.name, result.wall_time)
+        )
+    else:
+        logger.error(
+            "[%d/%d] Plot %s failed after %.2f s:\n%s"
+            % (result.index + 1, ntasks, result.name, result.wall_time, result.error)
+        )
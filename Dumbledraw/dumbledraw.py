@@ -6,19 +6,63 @@ import logging
 import copy
 import ROOT as R
 import math
+import os
+import time
+
+import numpy as np
 
 # import rootfile_parser
 logger = logging.getLogger(__name__)
 
+from . import hist_arrays
+from . import profiling
 from . import styles
+from . import uncertainties
+
+# formats that can be written from one rendered image of the canvas
+raster_formats = ["png", "jpg", "jpeg", "gif", "bmp", "tiff", "xpm"]
+
+
+# native copy of a histogram or graph which is not attached to any directory
+def clone(obj):
+    copied = obj.Clone()
+    R.SetOwnership(copied, True)
+    if isinstance(copied, R.TH1):
+        copied.SetDirectory(0)
+        profiling.count("histogram_copies")
+    return copied
+
+
+# object registered in a subplot together with its group name, its draw option
+# (set via setGraphStyle) and whether it is shared read-only with other subplots
+class Entry(object):
+    __slots__ = ["obj", "group", "style", "shared"]
+    # index access for compatibility with the former [object, group, style] lists
+    _fields = ["obj", "group", "style", "shared"]
+
+    def __init__(self, obj, group, style="", shared=False):
+        self.obj = obj
+        self.group = group
+        self.style = style
+        self.shared = shared
+
+    def __getitem__(self, index):
+        return getattr(self, self._fields[index])
+
+    def __setitem__(self, index, value):
+        setattr(self, self._fields[index], value)
 
 
 class Plot(object):
+    @profiling.timed()
     def __init__(self, splitlist, style="none", legend_outside=False, **kwargs):
         styles.SetStyle(style, **kwargs)
         R.gROOT.SetBatch(True)  # don't disply canvas
         self._canvas = R.TCanvas()
         self._canvas.cd()
+        self._text_pool = styles.TextPool()  # texts drawn on the pads of the plot
+        self._profile_start = profiling.snapshot()
+        self.profile_summary = None
         self._subplots = []
         self._legends = []
         self._lines = []
@@ -49,6 +93,61 @@ class Plot(object):
 
         if legend_outside:
             self._subplots = [Subplot(0, -0.03, 0.90)]
+        self._layout = list(self._subplots)
+        for subplot in self._layout:
+            subplot._text_pool = self._text_pool
+
+    # clears the canvas and the subplots for the next plot with the same layout
+    @profiling.timed()
+    def _reset(self):
+        for subplot in self._inlets:
+            subplot.close()
+        # the canvas deletes the pads drawn on it when cleared, so the pads of the
+        # layout are taken off the canvas before and drawn again afterwards
+        primitives = self._canvas.GetListOfPrimitives()
+        for subplot in self._layout:
+            subplot.reset()
+            primitives.Remove(subplot._pad)
+        self._canvas.Clear()
+        self._canvas.cd()
+        for subplot in self._layout:
+            subplot._pad.Draw()
+        self._text_pool.release()
+        self._profile_start = profiling.snapshot()
+        self.profile_summary = None
+        self._subplots = list(self._layout)
+        self._legends = []
+        self._lines = []
+        self._inlet_lines = []
+        self._inlets = []
+        self._inlets_legends = []
+
+    # deletes the canvas, the pads and all drawn objects of the plot right away
+    # instead of leaving them to the garbage collection. The plot cannot be used
+    # afterwards.
+    def close(self):
+        if self._canvas is None:
+            return
+        # the pads are deleted with the canvas, so they are cleared before
+        for subplot in self._layout + self._inlets:
+            subplot.close()
+        self._text_pool.clear()
+        self._canvas.Clear()
+        self._subplots = []
+        self._layout = []
+        self._legends = []
+        self._lines = []
+        self._inlet_lines = []
+        self._inlets = []
+        self._inlets_legends = []
+        self._canvas.Close()
+        self._canvas = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
     @property
     def nsubplots(self):
@@ -112,10 +211,49 @@ class Plot(object):
             raise Exception
         return self._inlet_lines[index]
 
-    def save(self, outputname):
-        self._canvas.SaveAs(outputname)
-        logger.info("Created %s" % outputname)
+    # saves the canvas to a single file, a list of files or a basename combined with
+    # a list of formats, e.g. save("plot", ["png", "pdf"]). If several raster formats
+    # are requested, the canvas is rendered only once into an image which is written
+    # in all of them. Returns the time needed to write each file.
+    @profiling.timed()
+    def save(self, outputname, formats=None):
+        if formats is not None:
+            if isinstance(formats, str):
+                formats = [formats]
+            outputnames = [outputname + "." + fmt.lstrip(".") for fmt in formats]
+        elif isinstance(outputname, str):
+            outputnames = [outputname]
+        else:
+            outputnames = list(outputname)
+        raster_names = [
+            name
+            for name in outputnames
+            if os.path.splitext(name)[1][1:].lower() in raster_formats
+        ]
+        image = None
+        timings = {}
+        for name in outputnames:
+            start = time.time()
+            if len(raster_names) > 1 and name in raster_names:
+                if image is None:
+                    image = R.TImage.Create()
+                    image.FromPad(self._canvas)
+                image.WriteImage(name)
+            else:
+                self._canvas.SaveAs(name)
+            timings[name] = time.time() - start
+            logger.info("Created %s in %.3f s" % (name, timings[name]))
+        # stages profiled since the plot was created are stored with the plot
+        summary = profiling.summary(self._profile_start)
+        if summary is not None:
+            self.profile_summary = summary
+            if profiling.current().write_summaries and len(outputnames) > 0:
+                profiling.write_json(
+                    os.path.splitext(outputnames[0])[0] + ".profile.json", summary
+                )
+        return timings
 
+    @profiling.timed()
     def DrawChannelCategoryLabel(
         self,
         text,
@@ -131,7 +269,7 @@ class Plot(object):
             latex2.SetTextAngle(0)
             latex2.SetTextColor(R.kBlack)
             latex2.SetTextSize(0.03)
-            latex2.DrawLatex(0.755, 0.89, text)
+            styles.DrawLatex(latex2, 0.755, 0.89, text, self._text_pool)
         elif print_inside:
             latex2 = R.TLatex()
             latex2.SetNDC()
@@ -139,7 +277,7 @@ class Plot(object):
             latex2.SetTextAngle(0)
             latex2.SetTextColor(R.kBlack)
             latex2.SetTextSize(0.04)
-            latex2.DrawLatex(0.19, 0.720, text)
+            styles.DrawLatex(latex2, 0.19, 0.720, text, self._text_pool)
         else:
             ypos = 0.960 if "_{" in text else 0.955
             latex2 = R.TLatex()
@@ -150,8 +288,9 @@ class Plot(object):
             latex2.SetTextSize(textsize)
             if begin_left == None:
                 begin_left = 0.145
-            latex2.DrawLatex(begin_left, 0.960, text)
+            styles.DrawLatex(latex2, begin_left, 0.960, text, self._text_pool)
 
+    @profiling.timed()
     def DrawCMS(
         self,
         position=0,
@@ -183,6 +322,7 @@ class Plot(object):
                 extraOverCmsTextSize=0.8,
                 extraTextFont=42,
                 thesisstyle=thesisstyle,
+                text_pool=self._text_pool,
             )
         elif position == "outside":
             styles.DrawCMSLogo(
@@ -198,6 +338,7 @@ class Plot(object):
                 extraOverCmsTextSize=0.8,
                 extraTextFont=42,
                 thesisstyle=thesisstyle,
+                text_pool=self._text_pool,
             )
         elif position == "legend_outside":
             styles.DrawCMSLogo(
@@ -213,6 +354,7 @@ class Plot(object):
                 extraOverCmsTextSize=0.8,
                 extraTextFont=42,
                 thesisstyle=thesisstyle,
+                text_pool=self._text_pool,
             )
         else:
             styles.DrawCMSLogo(
@@ -228,8 +370,10 @@ class Plot(object):
                 extraOverCmsTextSize=0.8,
                 extraTextFont=42,
                 thesisstyle=thesisstyle,
+                text_pool=self._text_pool,
             )
 
+    @profiling.timed()
     def DrawLumi(self, lumi, textsize=0.6, legend_outside=False):
         if legend_outside:
             latex2 = R.TLatex()
@@ -238,10 +382,13 @@ class Plot(object):
             latex2.SetTextAngle(0)
             latex2.SetTextColor(R.kBlack)
             latex2.SetTextSize(0.03)
-            latex2.DrawLatex(0.75, 0.88, lumi)
+            styles.DrawLatex(latex2, 0.75, 0.88, lumi, self._text_pool)
         else:
-            styles.DrawTitle(self._subplots[0]._pad, lumi, 3, textsize)
+            styles.DrawTitle(
+                self._subplots[0]._pad, lumi, 3, textsize, text_pool=self._text_pool
+            )
 
+    @profiling.timed()
     def DrawText(self, x, y, text, textsize=0.04):
         ypos = 0.8
         latex2 = R.TLatex()
@@ -249,17 +396,48 @@ class Plot(object):
         latex2.SetTextAngle(0)
         latex2.SetTextColor(R.kBlack)
         latex2.SetTextSize(textsize)
-        latex2.DrawLatex(x, y, text)
-
-    def add_hist(self, hist, name, group_name="invisible"):
+        styles.DrawLatex(latex2, x, y, text, self._text_pool)
+
+    # by default all subplots share one read-only copy of the histogram. A subplot
+    # makes a private copy only before it modifies the histogram (copy-on-write).
+    @profiling.timed()
+    def add_hist(self, hist, name, group_name="invisible", shared=True):
+        if shared:
+            hist = clone(hist)
         for subplot in self._subplots:
-            subplot.add_hist(hist=hist, name=name, group_name=group_name)
+            subplot.add_hist(hist=hist, name=name, group_name=group_name, shared=shared)
 
     def add_graph(self, graph, name, group_name="invisible"):
         for subplot in self._subplots:
             subplot.add_graph(graph=graph, name=name, group_name=group_name)
 
+    # adds an uncertainty band to all subplots, see Subplot.add_band. In the
+    # subplots with the given indices the band is divided by the nominal values.
+    def add_band(
+        self,
+        name,
+        nominal,
+        syst_up=None,
+        syst_down=None,
+        kind="total",
+        ratio_subplots=None,
+        group_name="invisible",
+    ):
+        if ratio_subplots is None:
+            ratio_subplots = []
+        for index, subplot in enumerate(self._subplots):
+            subplot.add_band(
+                name,
+                nominal,
+                syst_up=syst_up,
+                syst_down=syst_down,
+                kind=kind,
+                ratio=index in ratio_subplots,
+                group_name=group_name,
+            )
+
     def add_inlet(self, inlet):
+        inlet._text_pool = self._text_pool
         self._inlets.append(inlet)
 
     def add_legend(
@@ -301,6 +479,7 @@ class Plot(object):
             )
         )
 
+    @profiling.timed()
     def setGraphStyle(
         self,
         name,
@@ -316,6 +495,8 @@ class Plot(object):
         alpha=1.0,
     ):
         for subplot in self._subplots:
+            # the style is identical for all subplots, so shared histograms can be
+            # modified in place
             subplot.setGraphStyle(
                 name=name,
                 markerstyle=markerstyle,
@@ -328,8 +509,10 @@ class Plot(object):
                 markersize=markersize,
                 fillstyle=fillstyle,
                 alpha=alpha,
+                copy_on_write=False,
             )
 
+    @profiling.timed()
     def create_stack(self, hist_names, name, group_name="invisible"):
         for subplot in self._subplots:
             subplot.create_stack(
@@ -412,6 +595,31 @@ class Plot(object):
             subplot.changeYLabels(replacement_list)
 
 
+class PlotTemplate(object):
+    """
+    Canvas and subplot pads of a layout, which are created and styled only once and reused for all plots with the same splitlist and style. new_plot clears the previous plot and returns the Plot to be filled next, so the previous plot has to be saved before.
+    """
+
+    def __init__(self, splitlist, style="none", legend_outside=False, **kwargs):
+        self._plot = Plot(splitlist, style, legend_outside, **kwargs)
+        self._used = False
+
+    def new_plot(self):
+        if self._used:
+            self._plot._reset()
+        self._used = True
+        return self._plot
+
+    def close(self):
+        self._plot.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
 class Subplot(object):
     def __init__(self, name, lower_bound=0.0, upper_bound=1.0):
         logger.debug(
@@ -432,8 +640,17 @@ class Subplot(object):
         self._pad.SetTopMargin(upper_margin)
         self._pad.SetFillStyle(4000)
         self._pad.Draw()
+        self._text_pool = None  # set by the plot
 
+        self._height = 1 - upper_margin - lower_margin
+        self._margins = self._get_margins()
+        self._reset_state()
+
+    # sets the objects and options of the subplot back to those of a new subplot
+    def _reset_state(self):
         self._hists = {}
+        self._groups = {}  # group name -> names of the histograms in the group
+        self._group_sums = {}  # group name -> cached sum of the group
         self._graphs = {}
         self._xlabel = None
         self._ylabel = None
@@ -454,13 +671,40 @@ class Subplot(object):
         self._ytitleoffsetscale = 1.0
         self._xlabeloffsetscale = 1.0
         self._ylabeloffsetscale = 1.0
-        self._height = 1 - upper_margin - lower_margin
         self._unroll = None
         self._unroll_pads = []
         self._unroll_label_pos = 9
         self._unroll_label_angle = 270
         self._unroll_label_scalesize = 1.0
         self._scale_ticklength = 1.0
+        self._axishist = None
+
+    def _get_margins(self):
+        return [
+            self._pad.GetLeftMargin(),
+            self._pad.GetRightMargin(),
+            self._pad.GetBottomMargin(),
+            self._pad.GetTopMargin(),
+        ]
+
+    # clears the pad for the next plot drawn with the same layout
+    def reset(self):
+        self._pad.Clear()
+        left, right, bottom, top = self._margins
+        self._pad.SetLeftMargin(left)
+        self._pad.SetRightMargin(right)
+        self._pad.SetBottomMargin(bottom)
+        self._pad.SetTopMargin(top)
+        self._pad.SetLogx(0)
+        self._pad.SetLogy(0)
+        self._pad.SetGrid(0, 0)
+        self._reset_state()
+
+    # deletes the pad and all objects of the subplot
+    def close(self):
+        self._pad.Clear()
+        self._reset_state()
+        self._pad = None
 
     @property
     def hists(self):
@@ -471,8 +715,10 @@ class Subplot(object):
         return self._graphs
 
     # adds histogram to subplot and assign individual name and group name. Default group name = "invisible" which is ignored by DrawAll function.
-    def add_hist(self, hist, name, group_name="invisible"):
-        if name in list(self._hists.keys()):
+    # If shared is True, the histogram is not copied and treated as read-only; it is replaced by a private copy before it is modified.
+    @profiling.timed()
+    def add_hist(self, hist, name, group_name="invisible", shared=False):
+        if name in self._hists:
             logger.fatal("Histogram name %s already used!")
             raise Exception
         if not (isinstance(hist, R.TH1D) or isinstance(hist, R.TH1F)):
@@ -480,14 +726,25 @@ class Subplot(object):
                 "add_hist expects a TH1F with name {}, got object {}".format(name, hist)
             )
             raise Exception
-        self._hists[name] = [
-            copy.deepcopy(hist),
-            group_name,
-            "",
-        ]  # last entry is used to save the markerstyle and set in a different function
+        self._add_entry(
+            name, Entry(hist if shared else clone(hist), group_name, "", shared)
+        )
+
+    def _add_entry(self, name, entry):
+        self._hists[name] = entry
+        self._groups.setdefault(entry.group, []).append(name)
+        self._invalidate(entry.group)
+
+    # drops the cached sum of a group after one of its members changed
+    def _invalidate(self, group_name):
+        self._group_sums.pop(group_name, None)
+
+    # returns the entries of all histograms with the given group name
+    def _group_entries(self, group_name):
+        return [self._hists[name] for name in self._groups.get(group_name, [])]
 
     def add_graph(self, graph, name, group_name="invisible"):
-        if name in list(self._graphs.keys()):
+        if name in self._graphs:
             logger.fatal("Graph name %s already used!")
             raise Exception
         if not isinstance(graph, R.TGraph):
@@ -497,40 +754,114 @@ class Subplot(object):
                 )
             )
             raise Exception
-        self._graphs[name] = [
-            copy.deepcopy(graph),
-            group_name,
-            "",
-        ]  # last entry is used to save the markerstyle and set in a different function
-
-    # returns histogram with given name or sum of histograms with given group name
-    def get_hist(self, name):
-        if name in list(self._hists.keys()):
-            if isinstance(self._hists[name][0], R.THStack):
+        self._graphs[name] = Entry(clone(graph), group_name)
+
+    # adds the stat, syst or total (stat and syst in quadrature) band around a
+    # nominal histogram or group of the subplot as TGraphAsymmErrors drawn with
+    # the style of uncertainty bands. The statistical uncertainties are the bin
+    # errors of the nominal histogram. The systematic ones are given as arrays of
+    # upward and downward uncertainties (see uncertainties.syst_band) or as names
+    # of histograms or groups holding the varied predictions. Instead of a name,
+    # nominal can be an UncertaintyBand. With ratio=True the band is divided by
+    # the nominal values, e.g. for ratio subplots.
+    @profiling.timed()
+    def add_band(
+        self,
+        name,
+        nominal,
+        syst_up=None,
+        syst_down=None,
+        kind="total",
+        ratio=False,
+        group_name="invisible",
+    ):
+        if name in self._graphs:
+            logger.fatal("Graph name %s already used!" % name)
+            raise Exception
+        if isinstance(nominal, UncertaintyBand):
+            band = nominal
+        else:
+            arrays = hist_arrays.to_arrays(self._get_hist(nominal, writable=False))
+            if isinstance(syst_up, str) or isinstance(syst_down, str):
+                # shifts of the varied predictions, shape [1, 2, bin]
+                shifts = np.array(
+                    [
+                        [
+                            self._band_contents(syst_up, arrays.contents),
+                            self._band_contents(syst_down, arrays.contents),
+                        ]
+                    ]
+                ) - np.asarray(arrays.contents, dtype=np.float64)
+                syst_up, syst_down = uncertainties.quadrature(shifts)
+            band = UncertaintyBand(
+                arrays.edges, arrays.contents, arrays.errors_up, syst_up, syst_down
+            )
+        self._graphs[name] = Entry(band.graph(kind, ratio, name), group_name)
+        self.setGraphStyle(
+            name, "2", markersize=0, fillcolor=styles.color_dict["unc"], linecolor=0
+        )
+
+    # contents of the histogram or group with the given name, the nominal contents
+    # if no name is given
+    def _band_contents(self, name, nominal):
+        if name is None:
+            return nominal
+        return hist_arrays.to_arrays(self._get_hist(name, writable=False)).contents
+
+    # returns histogram with given name or sum of histograms with given group name.
+    # Group sums are cached until a member changes. With copy=False the cached sum itself is returned, which must not be modified.
+    def get_hist(self, name, copy=True):
+        hist = self._get_hist(name, writable=True)
+        if copy and not name in self._hists:
+            return clone(hist)
+        return hist
+
+    # internal version of get_hist, which does not copy shared histograms or group sums if they are only read
+    @profiling.timed()
+    def _get_hist(self, name, writable):
+        if name in self._hists:
+            if isinstance(self._hists[name].obj, R.THStack):
                 logger.fatal("get_hist does not accept names of stacks!")
                 raise Exception
-            return self._hists[name][0]
+            if writable:
+                return self._writable(self._hists[name])
+            return self._hists[name].obj
+        elif name in self._group_sums:
+            return self._group_sums[name]
         else:
-            empty = True
-            for entry in list(self._hists.values()):
-                if entry[1] == name:
-                    if isinstance(entry[0], R.THStack):
-                        logger.fatal("get_hist does not accept names of stacks!")
-                        raise Exception
-                    if empty:
-                        hist = copy.deepcopy(entry[0])
-                        hist.SetName(name)
-                        empty = False
-                    else:
-                        hist.Add(entry[0])
-            if empty:
+            entries = self._group_entries(name)
+            if len(entries) == 0:
                 logger.fatal("No histograms matching to name %s" % name)
                 raise Exception
-            else:
-                return hist
+            for entry in entries:
+                if isinstance(entry.obj, R.THStack):
+                    logger.fatal("get_hist does not accept names of stacks!")
+                    raise Exception
+            hist = clone(entries[0].obj)
+            hist.SetName(name)
+            hist_arrays.add(hist, [entry.obj for entry in entries[1:]])
+            self._group_sums[name] = hist
+            return hist
+
+    # returns the object of a histogram entry for modification. A shared object is replaced by a private copy first, also within the stacks of the subplot.
+    def _writable(self, entry):
+        self._invalidate(entry.group)  # the caller may change the contents
+        if not entry.shared:
+            return entry.obj
+        shared = entry.obj
+        entry.obj = clone(shared)
+        entry.shared = False
+        for other in list(self._hists.values()):
+            if isinstance(other.obj, R.THStack) and other.obj.GetHists():
+                members = other.obj.GetHists()
+                index = members.IndexOf(shared)
+                if index >= 0:
+                    members.RemoveAt(index)
+                    members.AddAt(entry.obj, index)
+        return entry.obj
 
     def get_graph(self, name):
-        if name in list(self._graphs.keys()):
+        if name in self._graphs:
             return self._graphs[name]
 
     # draws all histograms assigned to the subplot except those with group name "invisible"
@@ -538,61 +869,65 @@ class Subplot(object):
         if isinstance(self._unroll, list):
             self.DrawUnrolled(
                 [
-                    entry
-                    for entry in self._hists()
-                    if not self._hists[entry][1] == "invisible"
+                    name
+                    for name, entry in self._hists.items()
+                    if not entry.group == "invisible"
                 ]
             )
         else:
             isFirst = True
             for hist in list(self._hists.values()):
-                if not hist[1] == "invisible":
+                if not hist.group == "invisible":
                     self.DrawSingle(hist, isFirst)
                     isFirst = False
             R.gPad.RedrawAxis()
 
     # draws specific histograms assigned to the subplot selected via a list of individual names and/or group names
+    @profiling.timed()
     def Draw(self, names):
+        if isinstance(names, str):
+            names = [names]
         if isinstance(self._unroll, list):
             self.DrawUnrolled(names)
         else:
-            if isinstance(names, str):
-                names = [names]
             isFirst = True
             for name in names:
-                if name in list(self._hists.keys()):
+                if name in self._hists:
                     self.DrawSingle(self._hists[name], isFirst)
                     isFirst = False
-                elif name in list(self._graphs.keys()):
+                elif name in self._graphs:
                     self.DrawSingle(self._graphs[name], isFirst)
                     isFirst = False
                 else:
-                    for entry in list(self._hists.values()):
-                        if entry[1] == name:
-                            self.DrawSingle(entry, isFirst)
-                            isFirst = False
+                    for entry in self._group_entries(name):
+                        self.DrawSingle(entry, isFirst)
+                        isFirst = False
             R.gPad.RedrawAxis()
 
     # draws single ROOT histogram. If isFirst is True, formatting is applied and histogram overwrites existing drawings, else it is added
+    @profiling.timed()
     def DrawSingle(self, hist, isFirst):
         self._pad.cd()
         if isFirst:
-            # hist[0].Draw() # needed for stacks
+            # hist.obj.Draw() # needed for stacks
             if self._ylims != None and isinstance(
-                hist[0], R.THStack
+                hist.obj, R.THStack
             ):  # otherwise lims are not set without a unintended margin
-                copystack = copy.deepcopy(hist[0])
-                axishist = copystack.GetHists()[0]
-                self.setAxisStyles(axishist)
-                axishist.Draw(hist[2])
-                hist[0].Draw(hist[2] + "SAME")
+                # keep a reference, the copy is owned by Python
+                self._axishist = clone(hist.obj.GetHists()[0])
+                self.setAxisStyles(self._axishist)
+                self._axishist.Draw(hist.style)
+                hist.obj.Draw(hist.style + "SAME")
             else:
-                hist[0].Draw()  # needed for stacks
-                self.setAxisStyles(hist[0])
-                hist[0].Draw(hist[2])
+                if not isinstance(hist.obj, R.THStack):
+                    self._writable(hist)  # axis styles are set per subplot
+                hist.obj.Draw()  # needed for stacks
+                self.setAxisStyles(hist.obj)
+                hist.obj.Draw(hist.style)
         else:
-            hist[0].Draw(hist[2] + "SAME")
+            hist.obj.Draw(hist.style + "SAME")
 
+    @profiling.timed()
     def DrawUnrolled(self, names):
         if not isinstance(self._unroll, list):
             logger.fatal("A list of bin labels must be given for unrolling!")
@@ -601,7 +936,7 @@ class Subplot(object):
         n_selected_bins = len(self._selection)
         # determine ranges
         if self._xlims == None:
-            hist = self._hists[names[0]][0]
+            hist = self._hists[names[0]].obj
             if isinstance(hist, R.THStack):
                 hist = hist.GetHists()[0]
             self._xlims = [hist.GetXaxis().GetXmin(), hist.GetXaxis().GetXmax()]
@@ -623,12 +958,20 @@ class Subplot(object):
             )
         # fix ticklengths
         self._scale_ticklength = 2.0 / n_bins
-        # create subpads
-        copy_me = copy.deepcopy(self)
+        # fix y range
+        ylims = self._ylims
+        if ylims == None:
+            hist = self._hists[names[0]].obj
+            if isinstance(hist, R.THStack):
+                hist = hist.GetHists()[0]
+            ylims = [hist.GetMinimum() / 1.1, hist.GetMaximum() * 1.2]
+            if self._logy and ylims[0] == 0.0:
+                ylims[0] = ylims[1] / 10.0
+        # create subpads, which are views on the histograms of this subplot
         margin = 0.01 * axisrange / n_bins
         for i, idx in enumerate(self._selection):
-            self._unroll_pads.append(copy.deepcopy(copy_me))
-            self._unroll_pads[i]._unroll = self._unroll[idx]
+            self._unroll_pads.append(UnrolledSubplot(self, idx, self._unroll[idx]))
+            self._unroll_pads[i]._ylims = list(ylims)
             self._unroll_pads[i]._xlims = [
                 axis_borders[idx] + margin,
                 axis_borders[idx + 1] - margin,
@@ -653,21 +996,6 @@ class Subplot(object):
                     "{:.1f}".format(offs + 3 * incr),
                     " ",
                 ]
-
-            # fix y range
-            if self._ylims == None:
-                hist = self._hists[names[0]][0]
-                if isinstance(hist, R.THStack):
-                    copystack = copy.deepcopy(hist)
-                    hist = copystack.GetHists()[0]
-                self._unroll_pads[i]._ylims = [
-                    hist.GetMinimum() / 1.1,
-                    hist.GetMaximum() * 1.2,
-                ]
-                if self._logy and self._unroll_pads[i]._ylims[0] == 0.0:
-                    self._unroll_pads[i]._ylims[0] = (
-                        self._unroll_pads[i]._ylims[1] / 10.0
-                    )
         # draw subpads
         for unroll_pad in self._unroll_pads:
             unroll_pad.Draw(names)
@@ -677,6 +1005,7 @@ class Subplot(object):
                 unroll_pad._unroll_label_scalesize,
                 self._unroll_label_pos,
                 self._unroll_label_angle,
+                text_pool=self._text_pool,
             )
 
     def setXlabel(self, label):
@@ -731,6 +1060,7 @@ class Subplot(object):
         self._ylabeloffsetscale = val
 
     # internal method to apply formatting to initial histograms
+    @profiling.timed()
     def setAxisStyles(self, hist):
         # set axis labels
         if self._xlabel == None:
@@ -819,6 +1149,7 @@ class Subplot(object):
         hist.GetYaxis().SetMaxDigits(3)
 
     # sets style for specific histogram or group
+    @profiling.timed()
     def setGraphStyle(
         self,
         name,
@@ -832,56 +1163,54 @@ class Subplot(object):
         linestyle=1,
         fillstyle=1001,
         alpha=1.0,
+        copy_on_write=True,
     ):
         markerstyledict = {}
         if markerstyle in list(markerstyledict.keys()):
             markerstyle = markerstyledict[markerstyle]
-        if name in list(self._hists.keys()):
-            if isinstance(self._hists[name][0], R.THStack):
+        if name in self._hists:
+            entries = [self._hists[name]]
+        elif name in self._graphs:
+            graph = self._graphs[name]
+            graph.style = markerstyle
+            graph.obj.SetMarkerStyle(markershape)
+            graph.obj.SetMarkerColor(markercolor)
+            graph.obj.SetLineColor(linecolor)
+            graph.obj.SetFillColorAlpha(fillcolor, alpha)
+            graph.obj.SetLineWidth(linewidth)
+            graph.obj.SetMarkerSize(markersize)
+            graph.obj.SetLineStyle(linestyle)
+            graph.obj.SetFillStyle(fillstyle)
+            return
+        else:
+            entries = self._group_entries(name)
+            if len(entries) == 0:
+                raise Exception(
+                    "No object with name %s found in booked histograms" % name
+                )
+        for hist in entries:
+            if isinstance(hist.obj, R.THStack):
                 logger.warning("Adressed object is stack. Style cannot be set!")
                 return
-            self._hists[name][2] = markerstyle
-            self._hists[name][0].SetMarkerStyle(markershape)
-            self._hists[name][0].SetMarkerColor(markercolor)
-            self._hists[name][0].SetLineColor(linecolor)
-            self._hists[name][0].SetFillColor(fillcolor)
-            self._hists[name][0].SetLineWidth(linewidth)
-            self._hists[name][0].SetMarkerSize(markersize)
-            self._hists[name][0].SetLineStyle(linestyle)
-            self._hists[name][0].SetFillStyle(fillstyle)
-        elif name in list(self._graphs.keys()):
-            self._graphs[name][2] = markerstyle
-            self._graphs[name][0].SetMarkerStyle(markershape)
-            self._graphs[name][0].SetMarkerColor(markercolor)
-            self._graphs[name][0].SetLineColor(linecolor)
-            self._graphs[name][0].SetFillColorAlpha(fillcolor, alpha)
-            self._graphs[name][0].SetLineWidth(linewidth)
-            self._graphs[name][0].SetMarkerSize(markersize)
-            self._graphs[name][0].SetLineStyle(linestyle)
-            self._graphs[name][0].SetFillStyle(fillstyle)
-        else:
-            for hist in list(self._hists.values()):
-                if hist[1] == name:
-                    if isinstance(hist[0], R.THStack):
-                        logger.warning("Adressed object is stack. Style cannot be set!")
-                        return
-                    hist[2] = markerstyle
-                    hist[0].SetMarkerStyle(markershape)
-                    hist[0].SetMarkerColor(markercolor)
-                    hist[0].SetLineColor(linecolor)
-                    hist[0].SetFillColor(fillcolor)
-                    hist[0].SetLineWidth(linewidth)
-                    hist[0].SetMarkerSize(markersize)
-                    hist[0].SetLineStyle(linestyle)
-                    hist[0].SetFillStyle(fillstyle)
-                else:
-                    raise Exception(
-                        "No object with name %s found in booked histograms" % name
-                    )
+            self._invalidate(
+                hist.group
+            )  # the sum carries the style of its first member
+            if copy_on_write:
+                self._writable(hist)
+            hist.style = markerstyle
+            hist.obj.SetMarkerStyle(markershape)
+            hist.obj.SetMarkerColor(markercolor)
+            hist.obj.SetLineColor(linecolor)
+            hist.obj.SetFillColor(fillcolor)
+            hist.obj.SetLineWidth(linewidth)
+            hist.obj.SetMarkerSize(markersize)
+            hist.obj.SetLineStyle(linestyle)
+            hist.obj.SetFillStyle(fillstyle)
 
     # creates stack from registered histograms defined via name or group name
+    @profiling.timed()
     def create_stack(self, hist_names, name, group_name="invisible"):
-        if name in list(self._hists.keys()):
+        if name in self._hists:
             logger.fatal("Stack name %s already used!" % name)
             raise Exception
         stack = R.THStack("hs", "")
@@ -889,22 +1218,23 @@ class Subplot(object):
         if isinstance(hist_names, str):
             hist_names = [hist_names]
         for hist_name in hist_names:
-            if hist_name in list(self._hists.keys()):
-                stack.Add(self._hists[hist_name][0])
+            if hist_name in self._hists:
+                stack.Add(self._hists[hist_name].obj)
                 logger.debug("Added histogram %s to stack %s" % (hist_name, name))
             else:
-                for key, hist in self._hists.items():
-                    if hist_name == hist[1]:
-                        if isinstance(hist[0], R.THStack):
-                            logger.fatal(
-                                "Tried to import a stack into a stack, which is impossible!"
-                            )
-                            raise Exception
-                        stack.Add(hist[0])
-                        logger.debug("Added histogram %s to stack %s" % (key, name))
-        self._hists[name] = [stack, group_name, "hist"]
+                for key in self._groups.get(hist_name, []):
+                    hist = self._hists[key]
+                    if isinstance(hist.obj, R.THStack):
+                        logger.fatal(
+                            "Tried to import a stack into a stack, which is impossible!"
+                        )
+                        raise Exception
+                    stack.Add(hist.obj)
+                    logger.debug("Added histogram %s to stack %s" % (key, name))
+        self._add_entry(name, Entry(stack, group_name, "hist"))
 
     # normalizes one or more histograms to a given denominator
+    @profiling.timed()
     def normalize(self, nominator_names, denominator_names):
         # regularize inputs
         if isinstance(nominator_names, str):
@@ -912,42 +1242,40 @@ class Subplot(object):
         if isinstance(denominator_names, str):
             denominator_names = [denominator_names]
 
-        # sum up denominator
-        isFirst = True
+        # sum up denominator, its errors are not propagated
+        denominator = None
         for name in denominator_names:
-            if isFirst:
-                denominator = copy.deepcopy(self.get_hist(name))
-                isFirst = False
+            hist = self._get_hist(name, writable=False)
+            contents = hist_arrays.contents_view(hist)
+            if denominator is None:
+                denominator = np.array(contents, dtype=np.float64)
             else:
-                denominator.Add(self.get_hist(name))
-        # do not propagate denominator errors
-        for i in range(1, denominator.GetNbinsX() + 1):
-            denominator.SetBinError(i, 0.0)
+                denominator += contents
 
-        # normalize all nominator inputs
+        # normalize all nominator inputs at once
+        nominators = []
         for name in nominator_names:
-            if name in list(self._hists.keys()):
-                if isinstance(self._hists[name][0], R.THStack):
+            if name in self._hists:
+                entries = [self._hists[name]]
+            else:
+                entries = self._group_entries(name)
+            for hist in entries:
+                if isinstance(hist.obj, R.THStack):
                     logger.fatal("Stacks cannot be normalized!")
                     raise Exception
-                self._hists[name][0].Divide(denominator)
-            else:
-                for hist in list(self._hists.values()):
-                    if hist[1] == name:
-                        if isinstance(hist[0], R.THStack):
-                            logger.fatal("Stacks cannot be normalized!")
-                            raise Exception
-                        hist[0].Divide(denominator)
+                nominators.append(self._writable(hist))
+        hist_arrays.divide(nominators, denominator)
 
     # normalizes bin contents of all histograms in the subplot to their bin width
+    @profiling.timed()
     def normalizeByBinWidth(self):
-        for hist in list(self._hists.values()):
-            if not isinstance(hist[0], R.THStack):
-                denominator = copy.deepcopy(hist[0])
-                for i in range(denominator.GetNbinsX()):
-                    denominator.SetBinContent(i + 1, denominator.GetBinWidth(i + 1))
-                    denominator.SetBinError(i + 1, 0.0)
-                hist[0].Divide(denominator)
+        hist_arrays.divide_by_bin_width(
+            [
+                self._writable(hist)
+                for hist in list(self._hists.values())
+                if not isinstance(hist.obj, R.THStack)
+            ]
+        )
 
     def unroll(
         self,
@@ -989,35 +1317,130 @@ class InletPlot(Subplot):
         self._pad = R.TPad("pad_" + str(name), "pad_" + str(name), x_1, y_1, x_2, y_2)
         self._pad.SetFillStyle(4000)
         self._pad.Draw()
+        self._text_pool = None  # set by the plot
 
-        self._hists = {}
-        self._graphs = {}
-        self._xlabel = None
-        self._ylabel = None
-        self._logx = False
-        self._logy = False
-        self._grid = False
-        self._xlims = None
-        self._ylims = None
-        self._xlabelsize = None
-        self._ylabelsize = None
-        self._xtitlesize = None
-        self._ytitlesize = None
-        self._nxdivisions = None
-        self._nydivisions = None
-        self._changexlabels = None
-        self._changeylabels = None
-        self._xtitleoffsetscale = 1.0
-        self._ytitleoffsetscale = 1.0
-        self._xlabeloffsetscale = 1.0
-        self._ylabeloffsetscale = 1.0
         self._height = y_2 - y_1
-        self._unroll = None
+        self._margins = self._get_margins()
+        self._reset_state()
+
+
+class UnrolledSubplot(Subplot):
+    """
+    Subpad showing a single bin of an unrolled subplot. The histograms, graphs and stacks are referenced from the parent subplot, only the pad, the axis ranges and the label settings belong to the subpad.
+    """
+
+    # axis and label settings taken over from the parent subplot
+    _inherited_attributes = [
+        "_xlabel",
+        "_ylabel",
+        "_logx",
+        "_logy",
+        "_grid",
+        "_xlims",
+        "_ylims",
+        "_xlabelsize",
+        "_ylabelsize",
+        "_xtitlesize",
+        "_ytitlesize",
+        "_nxdivisions",
+        "_nydivisions",
+        "_changexlabels",
+        "_changeylabels",
+        "_xtitleoffsetscale",
+        "_ytitleoffsetscale",
+        "_xlabeloffsetscale",
+        "_ylabeloffsetscale",
+        "_height",
+        "_unroll_label_pos",
+        "_unroll_label_angle",
+        "_unroll_label_scalesize",
+        "_scale_ticklength",
+    ]
+
+    def __init__(self, parent, index, label):
+        for attribute in self._inherited_attributes:
+            setattr(self, attribute, copy.copy(getattr(parent, attribute)))
+        self._hists = parent._hists
+        self._groups = parent._groups
+        self._group_sums = parent._group_sums
+        self._graphs = parent._graphs
+        name = "%s_unrolled_%d" % (parent._pad.GetName(), index)
+        self._pad = R.TPad(name, name, 0.0, 0.0, 1.0, 1.0)
+        self._pad.SetTopMargin(parent._pad.GetTopMargin())
+        self._pad.SetBottomMargin(parent._pad.GetBottomMargin())
+        self._pad.SetFillStyle(4000)
+        self._unroll = label
         self._unroll_pads = []
-        self._unroll_label_pos = 9
-        self._unroll_label_angle = 270
-        self._unroll_label_scalesize = 1.0
-        self._scale_ticklength = 1.0
+        self._text_pool = parent._text_pool
+        self._frame = None
+
+    # the axis is drawn on an empty copy of the first object, so that the shared histograms are not modified
+    @profiling.timed()
+    def DrawSingle(self, hist, isFirst):
+        self._pad.cd()
+        if isFirst:
+            axisobject = hist.obj
+            if isinstance(axisobject, R.THStack):
+                axisobject = axisobject.GetHists()[0]
+            elif isinstance(axisobject, R.TGraph):
+                axisobject = axisobject.GetHistogram()
+            self._frame = clone(axisobject)
+            self._frame.Reset()
+            self.setAxisStyles(self._frame)
+            self._frame.Draw("AXIS")
+        hist.obj.Draw(hist.style + "SAME")
+
+
+# uncertainty band of a nominal prediction computed with NumPy. stat holds the
+# statistical, syst_up and syst_down the systematic uncertainties per bin; missing
+# uncertainties are zero.
+class UncertaintyBand(object):
+    kinds = ["stat", "syst", "total"]
+
+    def __init__(self, edges, nominal, stat=None, syst_up=None, syst_down=None):
+        self.edges = np.asarray(edges, dtype=np.float64)
+        self.nominal = np.asarray(nominal, dtype=np.float64)
+        zeros = np.zeros_like(self.nominal)
+        self.stat = zeros if stat is None else np.asarray(stat, dtype=np.float64)
+        self.syst_up = (
+            zeros if syst_up is None else np.asarray(syst_up, dtype=np.float64)
+        )
+        self.syst_down = (
+            zeros if syst_down is None else np.asarray(syst_down, dtype=np.float64)
+        )
+        for array in [self.stat, self.syst_up, self.syst_down]:
+            if array.shape != self.nominal.shape:
+                logger.fatal(
+                    "Uncertainties of shape %s do not match %d bins!"
+                    % (array.shape, len(self.nominal))
+                )
+                raise Exception
+
+    # returns the upward and downward uncertainties of the given kind
+    def errors(self, kind="total"):
+        if kind == "stat":
+            return self.stat, self.stat
+        elif kind == "syst":
+            return self.syst_up, self.syst_down
+        elif kind == "total":
+            return np.hypot(self.stat, self.syst_up), np.hypot(
+                self.stat, self.syst_down
+            )
+        logger.fatal("Unknown band kind %s, choose one of %s!" % (kind, self.kinds))
+        raise Exception
+
+    # returns the band as graph, relative to the nominal values if ratio is True.
+    # Bins with zero nominal value get no uncertainty in the ratio.
+    def graph(self, kind="total", ratio=False, name="band"):
+        values = self.nominal
+        up, down = self.errors(kind)
+        if ratio:
+            nonzero = values != 0.0
+            scale = np.divide(1.0, values, out=np.zeros_like(values), where=nonzero)
+            values = nonzero.astype(np.float64)
+            up = up * scale
+            down = down * scale
+        return uncertainties.to_graph(self.edges, values, up, down, name)
 
 
 class Line(object):
@@ -1102,6 +1525,7 @@ class Legend(object):
         self._FillColor = 0
         self._alpha = 1.0
 
+    @profiling.timed()
     def add_entry(self, subplot_index, histname, label, style):
         if not isinstance(subplot_index, int):
             logger.fatal("Subplot index is supposed to be of type int!")
@@ -1109,13 +1533,13 @@ class Legend(object):
         if subplot_index >= len(self._subplots):
             logger.fatal("Subplot index is out of range!")
             raise Exception
-        if histname in list(self._subplots[subplot_index]._hists.keys()):
+        if histname in self._subplots[subplot_index]._hists:
             self._legend.AddEntry(
-                self._subplots[subplot_index]._hists[histname][0], label, style
+                self._subplots[subplot_index]._hists[histname].obj, label, style
             )
-        elif histname in list(self._subplots[subplot_index]._graphs.keys()):
+        elif histname in self._subplots[subplot_index]._graphs:
             self._legend.AddEntry(
-                self._subplots[subplot_index]._graphs[histname][0], label, style
+                self._subplots[subplot_index]._graphs[histname].obj, label, style
             )
         else:
             logger.fatal("Requested histogram for legend does not exist!")
@@ -1133,6 +1557,7 @@ class Legend(object):
     def setAlpha(self, val):
         self._alpha = val
 
+    @profiling.timed()
     def Draw(self):
         self._legend.SetTextFont(42)
         self._legend.SetTextSize(0.025 * self._textsizescale)
@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import collections
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# contents and errors hold the bins 1 ... N, under- and overflow are kept separately.
+# For batches every field gains a leading dimension, except for the shared edges.
+HistArrays = collections.namedtuple(
+    "HistArrays",
+    ["edges", "contents", "errors_up", "errors_down", "underflow", "overflow"],
+)
+
+# TH1 classes inherit their bin storage from one of the TArray classes
+_buffer_types = [
+    ("TArrayD", np.float64),
+    ("TArrayF", np.float32),
+    ("TArrayI", np.int32),
+    ("TArrayS", np.int16),
+    ("TArrayC", np.int8),
+]
+
+_error_option_normal = 0  # TH1::kNormal
+
+
+def _view(pointer, size, dtype):
+    pointer.reshape((size,))
+    return np.frombuffer(pointer, dtype=dtype, count=size)
+
+
+def buffer_dtype(hist):
+    for array_class, dtype in _buffer_types:
+        if hist.InheritsFrom(array_class):
+            return dtype
+    logger.fatal("Cannot map the bin storage of %s to a NumPy type!" % hist.GetName())
+    raise Exception
+
+
+# returns a writable view on the bin contents including under- and overflow
+def contents_view(hist):
+    return _view(hist.GetArray(), hist.GetNcells(), buffer_dtype(hist))
+
+
+# returns a writable view on the sum of squared weights or None if not stored
+def sumw2_view(hist):
+    if hist.GetSumw2N() == 0:
+        return None
+    return _view(hist.GetSumw2().GetArray(), hist.GetNcells(), np.float64)
+
+
+def edges(hist):
+    axis = hist.GetXaxis()
+    xbins = axis.GetXbins()
+    if xbins.GetSize() > 0:
+        return _view(xbins.GetArray(), xbins.GetSize(), np.float64)
+    return np.linspace(axis.GetXmin(), axis.GetXmax(), axis.GetNbins() + 1)
+
+
+# returns the arrays of the histogram as views on its buffers (except for the
+# errors of histograms with asymmetric errors). They are only valid as long as the
+# histogram is alive and unchanged, so use this only for histograms owned by the
+# caller and copy the arrays otherwise.
+def to_arrays(hist):
+    contents = contents_view(hist)
+    sumw2 = sumw2_view(hist)
+    if hist.GetBinErrorOption() != _error_option_normal:
+        # asymmetric (e.g. Poisson) errors are only available bin by bin
+        nbins = hist.GetNbinsX()
+        errors_up = np.array([hist.GetBinErrorUp(i) for i in range(1, nbins + 1)])
+        errors_down = np.array([hist.GetBinErrorLow(i) for i in range(1, nbins + 1)])
+    else:
+        errors_up = np.sqrt(
+            sumw2[1:-1] if sumw2 is not None else np.abs(contents[1:-1])
+        )
+        errors_down = errors_up
+    return HistArrays(
+        edges=edges(hist),
+        contents=contents[1:-1],
+        errors_up=errors_up,
+        errors_down=errors_down,
+        underflow=contents[0],
+        overflow=contents[-1],
+    )
+
+
+# copies the arrays, e.g. to keep them after the histogram they view is freed
+def copy(arrays):
+    return HistArrays(
+        *(
+            np.array(field) if isinstance(field, np.ndarray) else field
+            for field in arrays
+        )
+    )
+
+
+# arrays with the binning of the given ones and all contents and errors set to zero
+def zeros_like(arrays):
+    zeros = np.zeros_like(arrays.contents)
+    return HistArrays(
+        edges=arrays.edges,
+        contents=zeros,
+        errors_up=zeros,
+        errors_down=zeros,
+        underflow=zeros.dtype.type(0),
+        overflow=zeros.dtype.type(0),
+    )
+
+
+# combines the arrays of several histograms with identical binning into 2D arrays
+def stack(arrays_list):
+    if len(arrays_list) == 0:
+        logger.fatal("Cannot stack an empty list of histogram arrays!")
+        raise Exception
+    first_edges = arrays_list[0].edges
+    for arrays in arrays_list[1:]:
+        if not np.array_equal(arrays.edges, first_edges):
+            logger.fatal("Cannot stack histograms with different binning!")
+            raise Exception
+    return HistArrays(
+        edges=first_edges,
+        contents=np.stack([arrays.contents for arrays in arrays_list]),
+        errors_up=np.stack([arrays.errors_up for arrays in arrays_list]),
+        errors_down=np.stack([arrays.errors_down for arrays in arrays_list]),
+        underflow=np.array([arrays.underflow for arrays in arrays_list]),
+        overflow=np.array([arrays.overflow for arrays in arrays_list]),
+    )
+
+
+# sums the arrays of histograms with identical binning, each multiplied by its
+# scale factor, e.g. those of several files. Errors are added in quadrature.
+def merge(arrays_list, scale_factors=None):
+    if len(arrays_list) == 0:
+        logger.fatal("Cannot merge an empty list of histogram arrays!")
+        raise Exception
+    for arrays in arrays_list[1:]:
+        if not np.array_equal(arrays.edges, arrays_list[0].edges):
+            logger.fatal("Cannot merge histograms with different binning!")
+            raise Exception
+    if scale_factors is None:
+        scale_factors = np.ones(len(arrays_list))
+    scale_factors = np.asarray(scale_factors, dtype=np.float64)
+
+    def total(field):
+        return np.tensordot(
+            scale_factors, np.stack([getattr(a, field) for a in arrays_list]), axes=1
+        )
+
+    def quadrature(field):
+        return np.sqrt(
+            np.tensordot(
+                np.square(scale_factors),
+                np.stack([np.square(getattr(a, field)) for a in arrays_list]),
+                axes=1,
+            )
+        )
+
+    # the edges may view the buffers of a histogram that is freed later on
+    return HistArrays(
+        edges=np.array(arrays_list[0].edges),
+        contents=total("contents"),
+        errors_up=quadrature("errors_up"),
+        errors_down=quadrature("errors_down"),
+        underflow=total("underflow"),
+        overflow=total("overflow"),
+    )
+
+
+# writes the contents and upward errors of the arrays into a histogram with the
+# same binning. The errors of under- and overflow are taken from their contents.
+def fill(hist, arrays):
+    if hist.GetNcells() != len(arrays.contents) + 2:
+        logger.fatal("Cannot fill histogram with arrays of different binning!")
+        raise Exception
+    if hist.GetSumw2N() == 0:
+        hist.Sumw2()
+    contents = contents_view(hist)
+    contents[0] = arrays.underflow
+    contents[1:-1] = arrays.contents
+    contents[-1] = arrays.overflow
+    sumw2 = sumw2_view(hist)
+    sumw2[0] = abs(arrays.underflow)
+    sumw2[1:-1] = np.square(arrays.errors_up)
+    sumw2[-1] = abs(arrays.overflow)
+    hist.ResetStats()
+    hist.SetEntries(float(np.sum(arrays.contents)))
+
+
+# adds the contents of the given histograms in place to hist like a chain of
+# TH1::Add calls. Squared weights are stored as soon as one input stores them.
+def add(hist, others):
+    for other in others:
+        if other.GetNcells() != hist.GetNcells():
+            logger.fatal("Cannot add histograms with different binning!")
+            raise Exception
+    if len(others) == 0:
+        return
+    if hist.GetSumw2N() == 0 and any(other.GetSumw2N() > 0 for other in others):
+        hist.Sumw2()
+    entries = hist.GetEntries() + sum(other.GetEntries() for other in others)
+    contents = contents_view(hist)
+    contents += np.sum([contents_view(other) for other in others], axis=0)
+    sumw2 = sumw2_view(hist)
+    if sumw2 is not None:
+        for other in others:
+            other_sumw2 = sumw2_view(other)
+            sumw2 += (
+                other_sumw2 if other_sumw2 is not None else np.abs(contents_view(other))
+            )
+    hist.ResetStats()
+    hist.SetEntries(entries)
+
+
+# divides the contents of all given histograms in place by the given denominator
+# contents (including under- and overflow) without propagating denominator errors.
+# As for TH1::Divide, bins with a vanishing denominator are set to zero.
+def divide(hists, denominator):
+    denominator = np.asarray(denominator, dtype=np.float64)
+    scale = np.zeros_like(denominator)
+    np.divide(1.0, denominator, out=scale, where=denominator != 0.0)
+    for hist in hists:
+        if hist.GetNcells() != denominator.size:
+            logger.fatal("Cannot divide histograms with different binning!")
+            raise Exception
+        _scale(hist, scale)
+
+
+# divides the contents of all given histograms in place by their bin widths,
+# under- and overflow are left unchanged
+def divide_by_bin_width(hists):
+    for hist in hists:
+        scale = np.ones(hist.GetNcells())
+        scale[1:-1] = 1.0 / np.diff(edges(hist))
+        _scale(hist, scale)
+
+
+def _scale(hist, scale):
+    if not np.issubdtype(buffer_dtype(hist), np.floating):
+        _scale_integer(hist, scale)
+        return
+    if hist.GetSumw2N() == 0:
+        hist.Sumw2()  # errors have to be stored explicitly once contents are scaled
+    contents = contents_view(hist)
+    contents *= scale
+    sumw2 = sumw2_view(hist)
+    sumw2 *= scale * scale
+    hist.ResetStats()
+
+
+# integer bin contents cannot hold the scaled values, so the histogram is scaled by
+# ROOT (multiplying by a histogram of the factors without errors), which rounds them
+# as TH1::Scale and TH1::Divide do
+def _scale_integer(hist, scale):
+    import ROOT as R
+
+    xedges = np.array(edges(hist), dtype=np.float64)
+    factors = R.TH1D(hist.GetName() + "_scale", "", len(xedges) - 1, xedges)
+    factors.SetDirectory(0)
+    factors.Sumw2()
+    for i, factor in enumerate(scale):
+        factors.SetBinContent(i, factor)
+    hist.Multiply(factors)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import collections
+import logging
+import threading
+
+import numpy as np
+
+from . import hist_arrays
+from . import profiling
+from .rootfile_pool import read_lock
+
+logger = logging.getLogger(__name__)
+
+# rough size of a TH1 object without its bin buffers
+_object_overhead = 1024
+
+
+def estimate_size(hist):
+    if not hist.InheritsFrom("TH1"):
+        return _object_overhead
+    itemsize = np.dtype(hist_arrays.buffer_dtype(hist)).itemsize
+    sumw2_size = 8 if hist.GetSumw2N() > 0 else 0
+    return _object_overhead + hist.GetNcells() * (itemsize + sumw2_size)
+
+
+# least recently used cache for histograms read from files. Entries are keyed by
+# the identity of the file and the path of the histogram inside the file. The
+# cache can be filled from a background thread, see prefetch.py.
+class Histogram_cache(object):
+    def __init__(self, max_bytes=512 * 1024**2):
+        self._lock = threading.RLock()
+        self._entries = collections.OrderedDict()
+        self._max_bytes = max_bytes
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @property
+    def max_bytes(self):
+        return self._max_bytes
+
+    def set_max_bytes(self, max_bytes):
+        with self._lock:
+            self._max_bytes = max_bytes
+            self._evict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, hist):
+        import ROOT
+
+        # detach from the file so that the histogram outlives it
+        if hist.InheritsFrom("TH1"):
+            hist.SetDirectory(0)
+        ROOT.SetOwnership(hist, True)
+        nbytes = estimate_size(hist)
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (hist, nbytes)
+            self._bytes += nbytes
+            self._evict()
+
+    # returns the cached histogram or reads it from the opened file. Missing keys
+    # are returned as the null pointer obtained from the file and not cached.
+    def get_or_read(self, rootfile, file_key, path):
+        key = (file_key, path)
+        hist = self.get(key)
+        if hist is not None:
+            profiling.count("histogram_cache.hits")
+            return hist
+        profiling.count("histogram_cache.misses")
+        with read_lock:
+            hist = rootfile.Get(path)
+        if hist:
+            self.put(key, hist)
+        return hist
+
+    def _evict(self):
+        while self._bytes > self._max_bytes and len(self._entries) > 1:
+            key, (hist, nbytes) = self._entries.popitem(last=False)
+            self._bytes -= nbytes
+            self._evictions += 1
+            logger.debug("Evicted %s from histogram cache" % (key,))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self._max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+            }
+
+
+# cache shared by all parser instances of this process
+histogram_cache = Histogram_cache()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+_end = object()  # marks the end of a prefetched stream
+
+
+# histogram found while walking a shape file. The key holds the arguments of the get
+# function of the parser, the histogram is read from the file by the backend of the
+# parser only when requested and is not added to the histogram cache.
+class HistogramItem(object):
+    __slots__ = ["key", "path", "_backend", "_data", "_hist"]
+
+    def __init__(self, key, path, backend):
+        self.key = key
+        self.path = path
+        self._backend = backend
+        self._data = None
+        self._hist = None
+
+    def __repr__(self):
+        return "HistogramItem(%s, %s)" % (self.key, self.path)
+
+    def load(self):
+        if self._data is None:
+            self._data = self._backend.load(self.path)
+        return self._data
+
+    def hist(self):
+        if self._hist is None:
+            self._hist = self._backend.to_root(self.load())
+        return self._hist
+
+    # the arrays may be views on the histogram buffers, which stay valid as long
+    # as the item is kept
+    def arrays(self):
+        return self._backend.to_arrays(self.load())
+
+
+# splits a key name like ZTT_CMS_scale_tUp into process and systematic. A name is
+# a variation if it ends with Up or Down and starts with the name of another key of
+# the same directory, which is the nominal histogram.
+def split_systematic(name, names):
+    if name.endswith("Up") or name.endswith("Down"):
+        position = name.rfind("_")
+        while position > 0:
+            if name[:position] in names:
+                return name[:position], name[position + 1 :]
+            position = name.rfind("_", 0, position)
+    return name, None
+
+
+# yields the items, reading the histograms of the next prefetch items in a
+# background thread. Memory use is bounded by the items held by the caller and
+# the prefetch queue. The file must not be read by other threads meanwhile.
+def stream(items, prefetch=0, backend=None):
+    if prefetch <= 0:
+        for item in items:
+            yield item
+        return
+    if backend is not None:
+        backend.enable_threads()
+    prefetched = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+
+    def put(entry):
+        while not stop.is_set():
+            try:
+                prefetched.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def reader():
+        try:
+            for item in items:
+                item.load()
+                if not put(item):
+                    return
+        except Exception as error:
+            put(error)
+            return
+        put(_end)
+
+    thread = threading.Thread(target=reader, name="histogram_stream")
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            entry = prefetched.get()
+            if entry is _end:
+                return
+            if isinstance(entry, Exception):
+                raise entry
+            yield entry
+    finally:
+        stop.set()
+        thread.join()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import collections
+import difflib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Resolves the arguments of get of the ntuple processor parsers to the keys of the
+# file, <dataset>#<channel>-<process>[-<category>]#<shape type>#<variable>. The keys
+# of the variable are parsed once into a table, so that a lookup is a dict access,
+# and missing keys are reported together with the available alternatives. The
+# process of a key is mapped back to the names used by the parser via its dataset
+# and process maps.
+
+
+class Key_resolver(object):
+    def __init__(self, names, dataset_map, process_map, variable):
+        self._variable = variable
+        # dataset -> processes of the parser and their name in the keys, None for data
+        candidates = collections.defaultdict(list)
+        for process, dataset in dataset_map.items():
+            if "data" in process:
+                candidates[dataset].append((process, None))
+            elif process in process_map:
+                candidates[dataset].append((process, process_map[process]))
+        self._processes = sorted(
+            process for entries in candidates.values() for process, _ in entries
+        )
+        self._table = {}  # (channel, process, category, shape type) -> key name
+        self._items = []  # key name and best matching fields in on-disk order
+        self._categories = collections.defaultdict(set)
+        self._shape_types = collections.defaultdict(set)
+        for name in names:
+            parts = name.split("#")
+            if len(parts) != 4 or parts[3] != variable:
+                continue
+            dataset, selection, shape_type = parts[:3]
+            channel, _, rest = selection.partition("-")
+            matches = []
+            for process, mapped in candidates.get(dataset, []):
+                if mapped is None:
+                    matches.append((0, process, rest))
+                elif rest == mapped:
+                    matches.append((len(mapped), process, ""))
+                elif rest.startswith(mapped + "-"):
+                    matches.append((len(mapped), process, rest[len(mapped) + 1 :]))
+            for _, process, category in matches:
+                category = category if category != "" else None
+                self._table[(channel, process, category, shape_type)] = name
+                self._categories[(channel, process)].add(category)
+                self._shape_types[(channel, process, category)].add(shape_type)
+            if len(matches) != 0:
+                _, process, category = max(matches, key=lambda match: match[0])
+                category = category if category != "" else None
+                self._items.append((name, (channel, process, category, shape_type)))
+        logger.debug(
+            "Resolved %d keys of variable %s" % (len(self._items), self._variable)
+        )
+
+    # returns the key name, fails with the available alternatives if it is missing
+    def resolve(self, channel, process, category=None, shape_type="Nominal"):
+        name = self._table.get((channel, process, category, shape_type))
+        if name is None:
+            logger.fatal(self._describe_missing(channel, process, category, shape_type))
+            raise Exception
+        return name
+
+    def _describe_missing(self, channel, process, category, shape_type):
+        if process not in self._processes:
+            return "Unknown process %s%s" % (
+                process,
+                _suggest(process, self._processes),
+            )
+        channels = self.channels()
+        if channel not in channels:
+            return "No histograms of variable %s in channel %s%s" % (
+                self._variable,
+                channel,
+                _suggest(channel, channels),
+            )
+        categories = self.categories(channel, process)
+        if len(categories) == 0:
+            return "No histograms of process %s in channel %s of variable %s" % (
+                process,
+                channel,
+                self._variable,
+            )
+        if category not in self._categories[(channel, process)]:
+            return "Category %s not found for %s in %s, available are %s%s" % (
+                category,
+                process,
+                channel,
+                categories,
+                _suggest(str(category), [str(c) for c in categories]),
+            )
+        shape_types = self.shape_types(channel, process, category)
+        return "Shape type %s not found for %s in %s category %s (%d available)%s" % (
+            shape_type,
+            process,
+            channel,
+            category,
+            len(shape_types),
+            _suggest(shape_type, shape_types),
+        )
+
+    def items(self):
+        return self._items
+
+    def processes(self):
+        return list(self._processes)
+
+    def channels(self):
+        return sorted(set(channel for channel, _ in self._categories))
+
+    # categories of the process in the channel, None if the keys have no category
+    def categories(self, channel, process):
+        return sorted(self._categories.get((channel, process), []), key=str)
+
+    def shape_types(self, channel, process, category=None):
+        return sorted(self._shape_types.get((channel, process, category), []))
+
+
+def _suggest(name, candidates):
+    matches = difflib.get_close_matches(name, candidates, n=3)
+    if len(matches) == 0:
+        return ""
+    return ", did you mean %s?" % " or ".join(matches)
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import inspect
+import logging
+
+import numpy as np
+
+from . import hist_arrays
+from . import profiling
+from . import rootfile_parser
+from .histogram_cache import histogram_cache
+
+logger = logging.getLogger(__name__)
+
+# Combines several shape files of the same layout, e.g. those of the eras of Run 2,
+# behind the interface of their parser. Every request is forwarded to all files and
+# the results are summed, each multiplied by the scale factor of its file. The
+# arguments of get can be overridden per file, e.g. the era of CombineHarvester
+# files:
+#
+#   run2 = Merged_rootfile_parser(
+#       ["2016.root", "2017.root", "2018.root"],
+#       arguments=[{"era": "2016"}, {"era": "2017"}, {"era": "2018"}],
+#   )
+#   hist = run2.get("Run2", "mt", "mt_1", "ZTT")  # the era passed here is ignored
+
+
+class Merged_rootfile_parser(object):
+    def __init__(
+        self,
+        inputrootfilenames,
+        parser=rootfile_parser.Rootfile_parser,
+        scale_factors=None,
+        arguments=None,
+        **kwargs
+    ):
+        if len(inputrootfilenames) == 0:
+            logger.fatal("At least one file has to be given!")
+            raise Exception
+        # files are opened with the given parser class and keyword arguments,
+        # already created parsers are used as they are
+        self._parsers = [
+            parser(filename, **kwargs) if isinstance(filename, str) else filename
+            for filename in inputrootfilenames
+        ]
+        nfiles = len(self._parsers)
+        self._scale_factors = np.ones(nfiles)
+        if scale_factors is not None:
+            self._scale_factors = np.asarray(scale_factors, dtype=np.float64)
+        self._arguments = [{}] * nfiles if arguments is None else arguments
+        if len(self._scale_factors) != nfiles or len(self._arguments) != nfiles:
+            logger.fatal(
+                "%d files need as many scale factors and argument overrides!" % nfiles
+            )
+            raise Exception
+        self._file_keys = tuple(p.backend.file_key for p in self._parsers)
+        logger.debug(
+            "Merged %d files with scale factors %s"
+            % (nfiles, self._scale_factors.tolist())
+        )
+
+    @property
+    def parsers(self):
+        return self._parsers
+
+    @property
+    def scale_factors(self):
+        return self._scale_factors
+
+    # arguments of the calls of the method for every file, all given by name
+    def _calls(self, method, args, kwargs):
+        signature = inspect.signature(getattr(self._parsers[0], method))
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        calls = []
+        for overrides in self._arguments:
+            call = dict(bound.arguments)
+            call.update(overrides)
+            calls.append(call)
+        return calls
+
+    # hashable key of the calls, lists of processes or systematics become tuples
+    def _cache_key(self, method, calls):
+        return (
+            self._file_keys,
+            method,
+            tuple(
+                tuple(
+                    (name, tuple(value) if isinstance(value, list) else value)
+                    for name, value in sorted(call.items())
+                )
+                for call in calls
+            ),
+        )
+
+    # returns the merged histogram, a copy of the histogram of the first file with
+    # the summed contents. Merged histograms are kept in the histogram cache, so
+    # repeated requests return the same object as for the other parsers.
+    @profiling.timed()
+    def get(self, *args, **kwargs):
+        calls = self._calls("get", args, kwargs)
+        key = self._cache_key("get", calls)
+        hist = histogram_cache.get(key)
+        if hist is None:
+            arrays = self._merge_arrays(calls)
+            hist = self._parsers[0].get(**calls[0]).Clone()
+            hist_arrays.fill(hist, arrays)
+            histogram_cache.put(key, hist)
+        return hist
+
+    # returns the summed NumPy arrays, see get_arrays of the parser class
+    @profiling.timed()
+    def get_arrays(self, *args, **kwargs):
+        return self._merge_arrays(self._calls("get_arrays", args, kwargs))
+
+    # the histograms of the files are read via the histogram cache, so only the
+    # cheap sum is repeated for every request
+    def _merge_arrays(self, calls):
+        return hist_arrays.merge(
+            [parser.get_arrays(**call) for parser, call in zip(self._parsers, calls)],
+            self._scale_factors,
+        )
+
+    # sum of the variations of all files, see Rootfile_parser.get_variations
+    @profiling.timed()
+    def get_variations(self, *args, **kwargs):
+        calls = self._calls("get_variations", args, kwargs)
+        return np.tensordot(
+            self._scale_factors,
+            np.stack(
+                [
+                    parser.get_variations(**call)
+                    for parser, call in zip(self._parsers, calls)
+                ]
+            ),
+            axes=1,
+        )
+
+    def get_bins(self, *args, **kwargs):
+        return self.get_arrays(*args, **kwargs).edges.tolist()
+
+    def get_values(self, *args, **kwargs):
+        return self.get_arrays(*args, **kwargs).contents.tolist()
+
+    def get_values_up(self, *args, **kwargs):
+        return self.get_arrays(*args, **kwargs).errors_up.tolist()
+
+    def get_values_down(self, *args, **kwargs):
+        return self.get_arrays(*args, **kwargs).errors_down.tolist()
@@ -0,0 +1,423 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import string
+
+from . import dumbledraw as dd
+from . import styles
+
+logger = logging.getLogger(__name__)
+
+# Declarative description of a plot, e.g. in yaml:
+#
+#   plot: {splits: [0.05], style: ModTDR, style_kwargs: {r: 0.04, l: 0.14}}
+#   lookup: [$channel, "${channel}_${category}", $process]
+#   processes:
+#     - {names: [ZTT, ZL, QCD], group: bkg, markerstyle: hist, fillcolor: $process}
+#     - {names: [data_obs], group: data_obs, markerstyle: e0, fillcolor: unc}
+#   stacks: [{name: stack, members: [bkg]}]
+#   subplots:
+#     0: {logy: true, ylims: [1, 1.0e+7], xlabel: $x_label, draw: [stack, data_obs]}
+#     1: {ylims: [0, 2], normalize: {nominators: [data_obs], denominators: [bkg]}}
+#   legends: [{width: 0.5, height: 0.08, ncolumns: 3, entries: [{names: [bkg], style: f}]}]
+#   labels: {cms: {}, lumi: "35.9 fb^{-1} (13 TeV)", channel_category: $channel_label}
+#   channel_labels: {mt: "#mu#tau_{h}"}
+#   output: ${channel}_${category}_${variable}
+#   formats: [png, pdf]
+#   channels: {tt: {subplots: {0: {ylims: [1, 1.0e+5]}}}}
+#
+# Strings may refer to the plot inputs (channel, category, variable and any
+# further keyword passed when rendering) via $name. $process is replaced while
+# compiling. Additionally $channel_label and $x_label are derived from the
+# channel_labels of the spec and styles.x_label_dict. The entries of channels
+# are merged into the spec for the given channel.
+
+_spec_keys = [
+    "plot",
+    "lookup",
+    "processes",
+    "stacks",
+    "subplots",
+    "scale",
+    "legends",
+    "labels",
+    "channel_labels",
+    "output",
+    "formats",
+    "channels",
+]
+_style_keys = [
+    "markershape",
+    "markercolor",
+    "linecolor",
+    "fillcolor",
+    "linewidth",
+    "linestyle",
+    "markersize",
+    "fillstyle",
+    "alpha",
+]
+_process_keys = ["names", "group", "lookup", "markerstyle", "subplots"] + _style_keys
+_color_keys = ["markercolor", "linecolor", "fillcolor"]
+_subplot_keys = [
+    "xlims",
+    "ylims",
+    "logx",
+    "logy",
+    "grid",
+    "xlabel",
+    "ylabel",
+    "nydivisions",
+    "normalize",
+    "normalize_by_bin_width",
+    "draw",
+]
+_scale_methods = [
+    "XLabelSize",
+    "YLabelSize",
+    "XTitleSize",
+    "YTitleSize",
+    "XTitleOffset",
+    "YTitleOffset",
+    "XLabelOffset",
+    "YLabelOffset",
+]
+
+
+def load_spec(path):
+    if path.endswith(".json"):
+        with open(path) as json_file:
+            return Plot_spec(json.load(json_file))
+    return Plot_spec(styles.load_yaml(path))
+
+
+def _check_keys(dictionary, allowed, where):
+    unknown = [key for key in dictionary if not key in allowed]
+    if unknown:
+        logger.fatal("Unknown keys %s in %s of plot spec!" % (unknown, where))
+        raise Exception
+
+
+def _merge(base, override):
+    merged = dict(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def _template(value, mapping=None):
+    if isinstance(value, str) and "$" in value:
+        template = string.Template(value)
+        if mapping is not None:
+            value = template.safe_substitute(mapping)
+            if not "$" in value:
+                return value
+            template = string.Template(value)
+        return template
+    return value
+
+
+def _substitute(value, inputs):
+    if isinstance(value, string.Template):
+        try:
+            return value.substitute(inputs)
+        except KeyError as error:
+            logger.fatal("Plot input %s is not given!" % error)
+            raise Exception
+    if isinstance(value, (list, tuple)):
+        return type(value)(_substitute(item, inputs) for item in value)
+    if isinstance(value, dict):
+        return {key: _substitute(item, inputs) for key, item in value.items()}
+    return value
+
+
+# a plot spec compiles into one plan per channel, which is cached and applied to
+# all categories and variables of that channel
+class Plot_spec(object):
+    def __init__(self, spec):
+        _check_keys(spec, _spec_keys, "top level")
+        self._spec = spec
+        self._plans = {}
+
+    def plan(self, channel=None):
+        if not channel in self._plans:
+            spec = self._spec
+            if channel in spec.get("channels", {}):
+                spec = _merge(spec, spec["channels"][channel])
+            self._plans[channel] = Plot_plan(spec)
+        return self._plans[channel]
+
+    def render(self, parser, channel, category, variable, **inputs):
+        return self.plan(channel).render(
+            parser, channel=channel, category=category, variable=variable, **inputs
+        )
+
+
+# sequence of calls on a dumbledraw.Plot with colors, labels and histogram lookups
+# resolved. Only the plot inputs are substituted when the plan is applied.
+class Plot_plan(object):
+    def __init__(self, spec):
+        self._lookups = []  # (name, group, parser arguments, subplots)
+        self._calls = []  # (subplot index or None for the plot, method, args, kwargs)
+        color_dict = styles.get_color_dict()
+        legend_label_dict = styles.get_legend_label_dict()
+        self._channel_labels = dict(spec.get("channel_labels", {}))
+        plot = spec.get("plot", {})
+        _check_keys(plot, ["splits", "style", "style_kwargs"], "plot")
+        self._splits = plot.get("splits", [])
+        self._style = plot.get("style", "none")
+        self._style_kwargs = plot.get("style_kwargs", {})
+
+        # histograms and their styles
+        groups = {}
+        for block in spec.get("processes", []):
+            _check_keys(block, _process_keys, "processes")
+            lookup = block.get("lookup", spec.get("lookup"))
+            if lookup is None:
+                logger.fatal("No parser lookup given for %s!" % block["names"])
+                raise Exception
+            group = block.get("group", "invisible")
+            for process in block["names"]:
+                mapping = {"process": process}
+                groups.setdefault(group, []).append(process)
+                self._lookups.append(
+                    (
+                        process,
+                        group,
+                        [_template(argument, mapping) for argument in lookup],
+                        block.get("subplots"),
+                    )
+                )
+                if not "markerstyle" in block:
+                    continue
+                kwargs = {}
+                for key in _style_keys:
+                    if key in block:
+                        kwargs[key] = self._resolve_color(
+                            key, _template(block[key], mapping), color_dict
+                        )
+                self._add_style_calls(
+                    process, block["markerstyle"], kwargs, block.get("subplots")
+                )
+        self._groups = groups
+
+        subplots = {
+            int(index): value for index, value in spec.get("subplots", {}).items()
+        }
+        for index, subplot in sorted(subplots.items()):
+            _check_keys(subplot, _subplot_keys, "subplot %d" % index)
+            if "normalize" in subplot:
+                self._calls.append(
+                    (
+                        index,
+                        "normalize",
+                        (
+                            subplot["normalize"]["nominators"],
+                            subplot["normalize"]["denominators"],
+                        ),
+                        {},
+                    )
+                )
+            if subplot.get("normalize_by_bin_width", False):
+                self._calls.append((index, "normalizeByBinWidth", (), {}))
+
+        for stack in spec.get("stacks", []):
+            _check_keys(stack, ["name", "members", "group"], "stacks")
+            self._calls.append(
+                (
+                    None,
+                    "create_stack",
+                    (stack["members"], stack["name"]),
+                    {"group_name": stack.get("group", "invisible")},
+                )
+            )
+
+        # axes
+        for index, subplot in sorted(subplots.items()):
+            for key, method in [("xlims", "setXlims"), ("ylims", "setYlims")]:
+                if key in subplot:
+                    self._calls.append((index, method, tuple(subplot[key]), {}))
+            for key, method in [
+                ("logx", "setLogX"),
+                ("logy", "setLogY"),
+                ("grid", "setGrid"),
+            ]:
+                if subplot.get(key, False):
+                    self._calls.append((index, method, (), {}))
+            for key, method in [("xlabel", "setXlabel"), ("ylabel", "setYlabel")]:
+                if key in subplot:
+                    self._calls.append((index, method, (_template(subplot[key]),), {}))
+            if "nydivisions" in subplot:
+                self._calls.append(
+                    (index, "setNYdivisions", tuple(subplot["nydivisions"]), {})
+                )
+        scale = spec.get("scale", {})
+        _check_keys(scale, _scale_methods, "scale")
+        for method in _scale_methods:
+            if method in scale:
+                self._calls.append((None, "scale" + method, (scale[method],), {}))
+        for index, subplot in sorted(subplots.items()):
+            if "draw" in subplot:
+                self._calls.append((index, "Draw", (subplot["draw"],), {}))
+
+        # legends, entries of a group are expanded to its members
+        for legend_index, legend in enumerate(spec.get("legends", [])):
+            _check_keys(
+                legend,
+                [
+                    "reference_subplot",
+                    "width",
+                    "height",
+                    "pos",
+                    "offset",
+                    "ncolumns",
+                    "reverse",
+                    "entries",
+                ],
+                "legends",
+            )
+            self._calls.append(
+                (
+                    None,
+                    "add_legend",
+                    (),
+                    {
+                        key: legend[key]
+                        for key in [
+                            "reference_subplot",
+                            "width",
+                            "height",
+                            "pos",
+                            "offset",
+                        ]
+                        if key in legend
+                    },
+                )
+            )
+            entries = []
+            for entry in legend.get("entries", []):
+                _check_keys(entry, ["subplot", "names", "label", "style"], "legends")
+                for name in entry["names"]:
+                    for member in groups.get(name, [name]):
+                        if "label" in entry:
+                            label = entry["label"]
+                        elif member in legend_label_dict:
+                            label = legend_label_dict[member]
+                        else:
+                            logger.fatal("No legend label found for %s!" % member)
+                            raise Exception
+                        entries.append(
+                            (
+                                entry.get("subplot", 0),
+                                member,
+                                _template(label, {"process": member}),
+                                entry.get("style", "f"),
+                            )
+                        )
+            if legend.get("reverse", False):
+                entries.reverse()
+            for entry in entries:
+                self._calls.append(("legend", "add_entry", (legend_index,) + entry, {}))
+            if "ncolumns" in legend:
+                self._calls.append(
+                    ("legend", "setNColumns", (legend_index, legend["ncolumns"]), {})
+                )
+            self._calls.append(("legend", "Draw", (legend_index,), {}))
+
+        labels = spec.get("labels", {})
+        _check_keys(labels, ["cms", "lumi", "channel_category"], "labels")
+        if "cms" in labels:
+            self._calls.append((None, "DrawCMS", (), labels["cms"] or {}))
+        for key, method in [
+            ("lumi", "DrawLumi"),
+            ("channel_category", "DrawChannelCategoryLabel"),
+        ]:
+            if key in labels:
+                self._calls.append((None, method, (_template(labels[key]),), {}))
+
+        self._output = _template(
+            spec.get("output", "${channel}_${category}_${variable}")
+        )
+        self._formats = spec.get("formats", ["pdf"])
+        self._template = None
+
+    @property
+    def groups(self):
+        return self._groups
+
+    def _resolve_color(self, key, value, color_dict):
+        if not key in _color_keys or not isinstance(value, str):
+            return value
+        if not value in color_dict:
+            logger.fatal("Color %s is not defined in the color dictionary!" % value)
+            raise Exception
+        return color_dict[value]
+
+    def _add_style_calls(self, name, markerstyle, kwargs, subplots):
+        if subplots is None:
+            self._calls.append((None, "setGraphStyle", (name, markerstyle), kwargs))
+        else:
+            for index in subplots:
+                self._calls.append(
+                    (index, "setGraphStyle", (name, markerstyle), kwargs)
+                )
+
+    def _inputs(self, inputs):
+        inputs = dict(inputs)
+        if "channel" in inputs:
+            inputs.setdefault(
+                "channel_label",
+                self._channel_labels.get(inputs["channel"], inputs["channel"]),
+            )
+        if "variable" in inputs:
+            inputs.setdefault(
+                "x_label",
+                styles.get_x_label_dict().get(inputs["variable"], inputs["variable"]),
+            )
+        return inputs
+
+    # creates the plot for the given inputs with histograms from the parser. The
+    # canvas is reused by the next call, so the plot has to be saved before.
+    def apply(self, parser, **inputs):
+        inputs = self._inputs(inputs)
+        if self._template is None:
+            self._template = dd.PlotTemplate(
+                self._splits, self._style, **self._style_kwargs
+            )
+        plot = self._template.new_plot()
+        for name, group, arguments, subplots in self._lookups:
+            hist = parser.get(*_substitute(arguments, inputs))
+            if subplots is None:
+                plot.add_hist(hist, name, group)
+            else:
+                for index in subplots:
+                    plot.subplot(index).add_hist(hist, name, group)
+        for target, method, args, kwargs in self._calls:
+            if target is None:
+                obj = plot
+            elif target == "legend":
+                obj = plot.legend(args[0])
+                args = args[1:]
+            else:
+                obj = plot.subplot(target)
+            getattr(obj, method)(
+                *_substitute(args, inputs), **_substitute(kwargs, inputs)
+            )
+        return plot
+
+    # frees the canvas reused by the plots of this plan
+    def close(self):
+        if self._template is not None:
+            self._template.close()
+            self._template = None
+
+    # creates and saves the plot, returns the names of the written files
+    def render(self, parser, **inputs):
+        plot = self.apply(parser, **inputs)
+        output = _substitute(self._output, self._inputs(inputs))
+        return list(plot.save(output, self._formats).keys())
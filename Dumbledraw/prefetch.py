@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import atexit
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+
+from . import backends
+from . import hist_arrays
+from . import shape_cache
+from .histogram_cache import histogram_cache
+
+logger = logging.getLogger(__name__)
+
+# Reads the histograms needed by the next plots into the histogram cache while the
+# current plot is drawn and saved, so that reading and drawing overlap:
+#
+#   for index, spec in enumerate(specs):
+#       if index + 1 < len(specs):
+#           rootfile.prefetch(keys_of(specs[index + 1]))
+#       ... get, draw and save the plot of spec ...
+#
+# The keys are tuples (or dicts) of arguments of the get function of the parser.
+# By default the histograms are read in a background thread. Since PyROOT keeps
+# the GIL while reading, a Prefetcher with processes > 0 reads them in worker
+# processes instead, which send back the arrays; the histograms are then created
+# as TH1D (see shape_cache.to_root). If a worker process dies, its results never
+# arrive, so wait gives up after the timeout of the prefetcher and terminates the
+# pool; the missing histograms are then read when they are requested.
+
+_stop = object()  # ends the thread of a prefetcher
+
+_worker_backends = {}  # backends opened by a worker process
+
+
+# reads the shapes of the given paths in a worker process, failures are skipped
+def _read_shapes(task):
+    filename, backend, paths = task
+    if not (filename, backend) in _worker_backends:
+        _worker_backends[(filename, backend)] = backends.open_backend(filename, backend)
+    reader = _worker_backends[(filename, backend)]
+    shapes = []
+    for path in paths:
+        try:
+            hist = reader.load(path)
+            # the arrays may view the buffers of hist, which is freed with the
+            # next histogram
+            shapes.append(
+                (
+                    path,
+                    shape_cache.Cached_shape(
+                        path.split("/")[-1],
+                        reader.title(hist),
+                        hist_arrays.copy(reader.to_arrays(hist)),
+                    ),
+                )
+            )
+        except Exception as error:
+            logger.warning("Cannot prefetch %s from %s: %s" % (path, filename, error))
+    return shapes
+
+
+class Prefetcher(object):
+    def __init__(self, processes=0, start_method="spawn", chunksize=16, timeout=600):
+        self._processes = processes
+        self._start_method = start_method
+        self._chunksize = chunksize
+        self._timeout = timeout
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pool = None
+        self._results = []
+
+    # schedules reading the histograms of the keys of the parser
+    def submit(self, parser, keys):
+        if self._processes > 0:
+            self._submit_to_pool(parser, keys)
+            return
+        parser.backend.enable_threads()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="prefetch")
+            self._thread.daemon = True
+            self._thread.start()
+        for key in keys:
+            self._queue.put((parser, key))
+
+    def _run(self):
+        while True:
+            task = self._queue.get()
+            try:
+                if task is _stop:
+                    return
+                parser, key = task
+                if isinstance(key, dict):
+                    parser.get(**key)
+                else:
+                    parser.get(*key)
+            except Exception as error:
+                logger.warning("Cannot prefetch %s: %s" % (task[1], error))
+            finally:
+                self._queue.task_done()
+
+    def _submit_to_pool(self, parser, keys):
+        backend = parser.backend
+        paths = []
+        for key in keys:
+            try:
+                if isinstance(key, dict):
+                    path = parser._hist_path(**key)
+                else:
+                    path = parser._hist_path(*key)
+            except Exception as error:
+                logger.warning("Cannot prefetch %s: %s" % (key, error))
+                continue
+            directory, _, name = path.rpartition("/")
+            if not backend.index.contains(directory, name):
+                logger.debug("Not prefetching missing histogram %s" % path)
+                continue
+            if (backend.file_key, path) in histogram_cache:
+                continue
+            paths.append(path)
+        if len(paths) == 0:
+            return
+        if self._pool is None:
+            import ROOT
+
+            # the histograms are created in the result thread of the pool
+            ROOT.EnableThreadSafety()
+            context = multiprocessing.get_context(self._start_method)
+            self._pool = context.Pool(self._processes)
+
+        # an exception raised here would end the result thread of the pool
+        def store(shapes):
+            for path, shape in shapes:
+                try:
+                    histogram_cache.put(
+                        (backend.file_key, path), shape_cache.to_root(shape)
+                    )
+                except Exception as error:
+                    logger.warning("Cannot prefetch %s: %s" % (path, error))
+
+        def failed(error):
+            logger.warning(
+                "Cannot prefetch from %s in worker process: %s"
+                % (backend.filename, error)
+            )
+
+        for start in range(0, len(paths), self._chunksize):
+            task = (
+                backend.filename,
+                backend.name,
+                paths[start : start + self._chunksize],
+            )
+            self._results.append(
+                self._pool.apply_async(
+                    _read_shapes, (task,), callback=store, error_callback=failed
+                )
+            )
+
+    # blocks until all submitted histograms are in the histogram cache or, for worker
+    # processes, the timeout is over
+    def wait(self):
+        if self._thread is not None:
+            self._queue.join()
+        deadline = None if self._timeout is None else time.time() + self._timeout
+        for result in self._results:
+            result.wait(None if deadline is None else max(0.0, deadline - time.time()))
+            if not result.ready():
+                logger.warning(
+                    "Prefetching did not finish within %s s, terminating the worker "
+                    "processes" % self._timeout
+                )
+                self._pool.terminate()
+                self._pool.join()
+                self._pool = None
+                break
+        self._results = []
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(_stop)
+            self._thread.join()
+            self._thread = None
+        # the pool cannot be joined while results of a dead worker are pending
+        self.wait()
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        self._results = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+# prefetcher used by the parsers by default
+prefetcher = Prefetcher()
+atexit.register(prefetcher.close)
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import collections
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Optional instrumentation of the plotting stages. The stages of Plot, Subplot,
+# Legend and the parsers are only timed while a profiler is active in the current
+# context, otherwise the decorated functions are called directly:
+#
+#   with profiling.profile() as profiler:
+#       ... create, draw and save plots ...
+#   profiling.write_json("profile.json", profiler.summary())
+#   profiling.write_chrome_trace("trace.json", [profiler.to_dict()])
+#
+# Times of nested stages are included in the time of the enclosing stage.
+
+_current = contextvars.ContextVar("dumbledraw_profiler", default=None)
+
+
+class Profiler(object):
+    def __init__(self, record_events=True, write_summaries=True):
+        self._record_events = record_events
+        self.write_summaries = write_summaries  # summary file next to saved plots
+        self._stages = collections.defaultdict(lambda: [0, 0.0])  # calls, seconds
+        self._counters = collections.defaultdict(int)
+        self._events = []  # name, start and duration in microseconds, pid, tid
+        # event times are given since the epoch to align the traces of several processes
+        self._origin = time.perf_counter() - time.time()
+
+    def record(self, name, start, duration):
+        stage = self._stages[name]
+        stage[0] += 1
+        stage[1] += duration
+        if self._record_events:
+            self._events.append(
+                (
+                    name,
+                    (start - self._origin) * 1e6,
+                    duration * 1e6,
+                    os.getpid(),
+                    threading.get_ident(),
+                )
+            )
+
+    def count(self, name, number=1):
+        self._counters[name] += number
+
+    def snapshot(self):
+        return (
+            {name: list(stage) for name, stage in self._stages.items()},
+            dict(self._counters),
+        )
+
+    # calls, total and mean time of every stage and the counters, optionally only
+    # those since the given snapshot
+    def summary(self, since=None):
+        stages_before, counters_before = since if since is not None else ({}, {})
+        stages = {}
+        for name, (calls, total) in self._stages.items():
+            calls_before, total_before = stages_before.get(name, [0, 0.0])
+            if calls == calls_before:
+                continue
+            calls -= calls_before
+            total -= total_before
+            stages[name] = {"calls": calls, "total": total, "mean": total / calls}
+        counters = {
+            name: number - counters_before.get(name, 0)
+            for name, number in self._counters.items()
+            if number != counters_before.get(name, 0)
+        }
+        return {"stages": stages, "counters": counters}
+
+    def to_dict(self):
+        profile = self.summary()
+        profile["events"] = list(self._events)
+        return profile
+
+    def reset(self):
+        self._stages.clear()
+        self._counters.clear()
+        self._events = []
+        self._origin = time.perf_counter() - time.time()
+
+
+# activates a profiler for the current context
+@contextlib.contextmanager
+def profile(profiler=None):
+    profiler = Profiler() if profiler is None else profiler
+    token = _current.set(profiler)
+    try:
+        yield profiler
+    finally:
+        _current.reset(token)
+
+
+def current():
+    return _current.get()
+
+
+# decorator timing the function as stage with the given name, by default the
+# module and the qualified name of the function, e.g. dumbledraw.Subplot.Draw
+def timed(name=None):
+    def decorator(function):
+        stage = name
+        if stage is None:
+            stage = "%s.%s" % (
+                function.__module__.split(".")[-1],
+                function.__qualname__,
+            )
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            profiler = _current.get()
+            if profiler is None:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profiler.record(stage, start, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+def count(name, number=1):
+    profiler = _current.get()
+    if profiler is not None:
+        profiler.count(name, number)
+
+
+def snapshot():
+    profiler = _current.get()
+    return None if profiler is None else profiler.snapshot()
+
+
+# summary of the active profiler since the snapshot or None if profiling is off
+def summary(since=None):
+    profiler = _current.get()
+    return None if profiler is None else profiler.summary(since)
+
+
+# adds up summaries, e.g. those of all plots of a batch
+def merge(summaries):
+    merged = {"stages": {}, "counters": {}}
+    for summary in summaries:
+        if summary is None:
+            continue
+        for name, stage in summary["stages"].items():
+            total = merged["stages"].setdefault(name, {"calls": 0, "total": 0.0})
+            total["calls"] += stage["calls"]
+            total["total"] += stage["total"]
+        for name, number in summary["counters"].items():
+            merged["counters"][name] = merged["counters"].get(name, 0) + number
+    for stage in merged["stages"].values():
+        stage["mean"] = stage["total"] / stage["calls"]
+    return merged
+
+
+def write_json(path, summary):
+    with open(path, "w") as json_file:
+        json.dump(summary, json_file, indent=2, sort_keys=True)
+
+
+# writes the events of the given profiles (see Profiler.to_dict) in the trace event
+# format, which can be opened in chrome://tracing or Perfetto
+def write_chrome_trace(path, profiles):
+    events = []
+    for profile in profiles:
+        if profile is None:
+            continue
+        for name, start, duration, pid, tid in profile.get("events", []):
+            events.append(
+                {
+                    "name": name,
+                    "cat": name.split(".")[0],
+                    "ph": "X",
+                    "ts": start,
+                    "dur": duration,
+                    "pid": pid,
+                    "tid": tid,
+                }
+            )
+    with open(path, "w") as trace_file:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, trace_file)
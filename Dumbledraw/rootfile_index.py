@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# indices already built in this process, keyed by file path and signature
+_indices = {}
+
+
+def file_signature(filename):
+    stat = os.stat(filename)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+# identifies a file by its location and content signature
+def file_identity(filename):
+    return (os.path.realpath(filename),) + tuple(file_signature(filename))
+
+
+def sidecar_path(filename):
+    return filename + ".keyindex.json"
+
+
+# scans all directories of a ROOT file once and keeps a map from directory
+# path ("" for the top level) to the key names it contains in on-disk order. An
+# already known map can be passed as directories instead.
+class Rootfile_index(object):
+    def __init__(self, rootfile, filename, sidecar=False, directories=None):
+        self._filename = filename
+        self._signature = file_signature(filename)
+        self._directories = directories
+        self._key_sets = {}
+        if sidecar and self._directories is None:
+            self._directories = self._load_sidecar()
+        if self._directories is None:
+            self._directories = {}
+            self._scan(rootfile, "")
+            logger.debug(
+                "Indexed %d directories in %s" % (len(self._directories), filename)
+            )
+            if sidecar:
+                self.save()
+
+    @property
+    def filename(self):
+        return self._filename
+
+    @property
+    def signature(self):
+        return self._signature
+
+    def _scan(self, directory, path):
+        if not hasattr(directory, "GetListOfKeys"):
+            return self._scan_uproot(directory, path)
+        keys = sorted(directory.GetListOfKeys(), key=lambda key: key.GetSeekKey())
+        names = []
+        seen = set()
+        for key in keys:
+            name = key.GetName()
+            if name in seen:  # older cycles of the same object
+                continue
+            seen.add(name)
+            names.append(name)
+            if key.IsFolder():
+                self._scan(
+                    directory.GetDirectory(name),
+                    name if path == "" else path + "/" + name,
+                )
+        self._directories[path] = names
+
+    # same for a directory opened with uproot, which lists the keys of the latest
+    # cycles only
+    def _scan_uproot(self, directory, path):
+        keys = [
+            directory.key(name) for name in directory.keys(recursive=False, cycle=False)
+        ]
+        names = []
+        for key in sorted(keys, key=lambda key: key.fSeekKey):
+            name = key.fName
+            names.append(name)
+            if key.fClassName.startswith("TDirectory"):
+                self._scan_uproot(
+                    directory[name], name if path == "" else path + "/" + name
+                )
+        self._directories[path] = names
+
+    def _load_sidecar(self):
+        path = sidecar_path(self._filename)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path) as sidecar_file:
+                content = json.load(sidecar_file)
+        except (IOError, ValueError) as error:
+            logger.warning("Ignoring unreadable key index %s: %s" % (path, error))
+            return None
+        if content.get("signature") != self._signature:
+            logger.debug("Key index %s is outdated" % path)
+            return None
+        logger.debug("Read key index %s" % path)
+        return content["directories"]
+
+    def save(self):
+        path = sidecar_path(self._filename)
+        try:
+            with open(path, "w") as sidecar_file:
+                json.dump(
+                    {"signature": self._signature, "directories": self._directories},
+                    sidecar_file,
+                )
+        except IOError as error:
+            logger.warning("Cannot write key index %s: %s" % (path, error))
+            return
+        logger.debug("Wrote key index %s" % path)
+
+    def directories(self):
+        return list(self._directories.keys())
+
+    def has_directory(self, directory):
+        return directory in self._directories
+
+    # returns the key names of a directory in on-disk order
+    def keys(self, directory=""):
+        return self._directories.get(directory, [])
+
+    def contains(self, directory, name):
+        if directory not in self._key_sets:
+            self._key_sets[directory] = set(self.keys(directory))
+        return name in self._key_sets[directory]
+
+
+# returns the index of an opened ROOT file, building it only once per process
+def get_index(rootfile, filename, sidecar=False):
+    cache_key = file_identity(filename)
+    if cache_key not in _indices:
+        _indices[cache_key] = Rootfile_index(rootfile, filename, sidecar)
+    return _indices[cache_key]
@@ -1,19 +1,43 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import collections
 import logging
-import ROOT
 import copy
 
+import numpy as np
+
+from . import backends
+from . import hist_arrays
+from . import histogram_stream
+from . import prefetch
+from . import profiling
+
 logger = logging.getLogger(__name__)
 
 
 class Rootfile_parser(object):
-    def __init__(self, inputrootfilename, mode="CombineHarvester", prefit=False):
+    # arguments of get, as found by iter_histograms
+    Key = collections.namedtuple(
+        "Key", ["era", "channel", "category", "process", "syst"]
+    )
+
+    def __init__(
+        self,
+        inputrootfilename,
+        mode="CombineHarvester",
+        prefit=False,
+        sidecar_index=False,
+        backend=None,
+    ):
         self._rootfilename = inputrootfilename
-        self._rootfile = ROOT.TFile(self._rootfilename, "READ")
+        self._backend = backends.open_backend(
+            self._rootfilename, backend, sidecar_index
+        )
+        # directory -> key names, scanned once and optionally stored next to the file
+        self._index = self._backend.index
         self._type = "control"
-        content = [entry.GetName() for entry in self._rootfile.GetListOfKeys()]
+        content = self._index.keys()
         for entry in content:
             if entry.endswith("prefit"):
                 self._type = "prefit"
@@ -24,6 +48,7 @@ class Rootfile_parser(object):
         logger.debug(
             "Identified rootfile %s as %s shapes" % (inputrootfilename, self._type)
         )
+        self._mode = mode
         if mode == "standard":
             self._hist_hash = "{channel}_{category}{plottype}/{process}{unc}"
         elif mode == "CombineHarvester":
@@ -35,9 +60,17 @@ class Rootfile_parser(object):
 
     @property
     def rootfile(self):
-        return self._rootfile
+        return self._backend.rootfile
 
-    def get(self, era, channel, category, process, syst=None):
+    @property
+    def backend(self):
+        return self._backend
+
+    @property
+    def index(self):
+        return self._index
+
+    def _hist_path(self, era, channel, category, process, syst=None):
         if syst != None and self._type != "control":
             logger.fatal("Uncertainty shapes are only available in control plots!")
             raise Exception
@@ -55,66 +88,175 @@ class Rootfile_parser(object):
         else:
             hist_hash = hist_hash.format(plottype="_" + self._type, unc="")
         logger.debug("Try to access %s in %s" % (hist_hash, self._rootfilename))
-        # perform check if file is available and otherwise return some dummy TH1F
-        available_processes = [
-            entry.GetName()
-            for entry in self._rootfile.Get(hist_hash.split("/")[0]).GetListOfKeys()
-        ]
-        if hist_hash.split("/")[1] in available_processes:
-            return self._rootfile.Get(hist_hash)
-        elif len(available_processes) != 0:
-            logger.warning(
-                "%s in %s does not exist !" % (hist_hash, self._rootfilename)
-            )
-            logger.debug(" Available Histograms are: %s" % available_processes)
-            logger.debug(" Returning a dummy histogram ")
-            dummy = self._rootfile.Get(
-                "{}/{}".format(hist_hash.split("/")[0], available_processes[0])
-            )
-            dummy.Reset()
-            dummy.SetTitle(process)
-            dummy.SetName(hist_hash)
-            return dummy
-        else:
+        return hist_hash
+
+    # path of a histogram of the directory to take the binning of a missing one from
+    def _dummy_path(self, hist_hash):
+        directory = hist_hash.split("/")[0]
+        available_processes = self._index.keys(directory)
+        if len(available_processes) == 0:
             logger.fatal(
                 " None of the requested Histograms are available in %s. Aborting."
-                % hist_hash.split("/")[0]
+                % directory
             )
             raise Exception
+        logger.warning("%s in %s does not exist !" % (hist_hash, self._rootfilename))
+        logger.debug(" Available Histograms are: %s" % available_processes)
+        logger.debug(" Returning a dummy histogram ")
+        return "{}/{}".format(directory, available_processes[0])
+
+    def _exists(self, hist_hash):
+        directory, hist_name = hist_hash.split("/")
+        return self._index.contains(directory, hist_name)
+
+    @profiling.timed()
+    def get(self, era, channel, category, process, syst=None):
+        hist_hash = self._hist_path(era, channel, category, process, syst)
+        # perform check if file is available and otherwise return some dummy TH1F
+        if self._exists(hist_hash):
+            return self._backend.get(hist_hash)
+        # work on a copy, the original may be shared through the histogram cache
+        dummy = self._backend.get(self._dummy_path(hist_hash)).Clone()
+        dummy.SetDirectory(0)
+        dummy.Reset()
+        dummy.SetTitle(process)
+        dummy.SetName(hist_hash)
+        return dummy
+
+    # reads the histograms of the keys, tuples or dicts of arguments of get, into
+    # the histogram cache in the background, see prefetch.Prefetcher
+    def prefetch(self, keys, prefetcher=None):
+        prefetcher = prefetch.prefetcher if prefetcher is None else prefetcher
+        prefetcher.submit(self, keys)
+
+    # walks all histograms of the file once in on-disk order and yields them as
+    # histogram_stream.HistogramItem, whose key can be passed to get. The
+    # histograms are read only when requested, the next prefetch of them in a
+    # background thread.
+    def iter_histograms(self, prefetch=0):
+        return histogram_stream.stream(self._iter_items(), prefetch, self._backend)
+
+    def _iter_items(self):
+        for directory in self._index.keys():
+            if not self._index.has_directory(directory):
+                continue
+            fields = self._parse_directory(directory)
+            if fields is None:
+                logger.debug("Skipping directory %s" % directory)
+                continue
+            era, channel, category = fields
+            names = self._index.keys(directory)
+            nominal_names = set(names)
+            for name in names:
+                if self._type == "control":
+                    process, syst = histogram_stream.split_systematic(
+                        name, nominal_names
+                    )
+                else:
+                    process, syst = name, None
+                yield histogram_stream.HistogramItem(
+                    self.Key(era, channel, category, process, syst),
+                    directory + "/" + name,
+                    self._backend,
+                )
+
+    # inverts the directory naming, channels are expected without underscores
+    def _parse_directory(self, directory):
+        if self._type != "control":
+            if not directory.endswith("_" + self._type):
+                return None
+            directory = directory[: -len(self._type) - 1]
+        if self._mode == "CombineHarvester":
+            if not directory.startswith("htt_"):
+                return None
+            directory, _, era = directory[4:].rpartition("_")
+        else:
+            era = None
+        channel, _, category = directory.partition("_")
+        if category == "":
+            return None
+        return era, channel, category
+
+    # returns NumPy arrays copied from the histogram buffers, or read from the
+    # file if the backend does not use ROOT. If a list of processes and/or
+    # systematics is given, the arrays of all combinations are stacked with the
+    # systematics varying fastest.
+    @profiling.timed()
+    def get_arrays(self, era, channel, category, process, syst=None):
+        if isinstance(process, list) or isinstance(syst, list):
+            processes = process if isinstance(process, list) else [process]
+            systs = syst if isinstance(syst, list) else [syst]
+            return hist_arrays.stack(
+                [
+                    self.get_arrays(era, channel, category, p, s)
+                    for p in processes
+                    for s in systs
+                ]
+            )
+        hist_hash = self._hist_path(era, channel, category, process, syst)
+        if self._exists(hist_hash):
+            return self._backend.arrays(hist_hash)
+        return hist_arrays.zeros_like(self._backend.arrays(self._dummy_path(hist_hash)))
+
+    # returns the contents of the Up and Down variations of the given processes and
+    # systematics (without the Up/Down suffix) as array of shape
+    # [process, systematic, 2, bin], where index 0 of the third axis is Up. The
+    # keys are resolved in one pass over the directory and read in on-disk order.
+    # Variations missing for a process are set to its nominal contents, i.e. the
+    # systematic is assumed not to affect the process.
+    @profiling.timed()
+    def get_variations(self, era, channel, category, processes, systematics):
+        if isinstance(processes, str):
+            processes = [processes]
+        if isinstance(systematics, str):
+            systematics = [systematics]
+        nominal = self.get_arrays(era, channel, category, list(processes)).contents
+        directory = self._hist_path(
+            era, channel, category, processes[0], systematics[0] + "Up"
+        ).split("/")[0]
+        positions = {
+            name: position for position, name in enumerate(self._index.keys(directory))
+        }
+        requests = []
+        for i, process in enumerate(processes):
+            for j, syst in enumerate(systematics):
+                for k, shift in enumerate(["Up", "Down"]):
+                    name = "%s_%s%s" % (process, syst, shift)
+                    if name in positions:
+                        requests.append((positions[name], i, j, k, name))
+                    else:
+                        logger.debug(
+                            "%s/%s does not exist, using nominal" % (directory, name)
+                        )
+        variations = np.empty(
+            (len(processes), len(systematics), 2, nominal.shape[-1]), dtype=np.float64
+        )
+        variations[...] = nominal[:, np.newaxis, np.newaxis, :]
+        for _, i, j, k, name in sorted(requests):
+            variations[i, j, k] = self._backend.arrays(directory + "/" + name).contents
+        return variations
 
     def get_bins(self, era, channel, category, process, syst=None):
-        hist = self.get(era, channel, category, process, syst)
-        nbins = hist.GetNbinsX()
-        bins = []
-        for i in range(nbins):
-            bins.append(hist.GetBinLowEdge(i + 1))
-        bins.append(hist.GetBinLowEdge(i + 1) + hist.GetBinWidth(i + 1))
-        return bins
+        return self.get_arrays(era, channel, category, process, syst).edges.tolist()
 
     def get_values(self, era, channel, category, process, syst=None):
-        hist = self.get(era, channel, category, process, syst)
-        nbins = hist.GetNbinsX()
-        values = []
-        for i in range(nbins):
-            values.append(hist.GetBinContent(i + 1))
-        return values
+        return self.get_arrays(era, channel, category, process, syst).contents.tolist()
 
     def get_values_up(self, era, channel, category, process, syst=None):
-        hist = self.get(era, channel, category, process, syst)
-        nbins = hist.GetNbinsX()
-        values = []
-        for i in range(nbins):
-            values.append(hist.GetBinErrDown(i + 1))
-        return values
+        arrays = self.get_arrays(era, channel, category, process, syst)
+        return arrays.errors_up.tolist()
 
     def get_values_down(self, era, channel, category, process, syst=None):
-        hist = self.get(era, channel, category, process, syst)
-        nbins = hist.GetNbinsX()
-        values = []
-        for i in range(nbins):
-            values.append(hist.GetBinErrDown(i + 1))
-        return values
+        arrays = self.get_arrays(era, channel, category, process, syst)
+        return arrays.errors_down.tolist()
 
+    # the backend is missing if the constructor failed, and at interpreter exit
+    # the modules needed to close it may already be torn down
     def __del__(self):
-        logger.debug("Closing rootfile %s" % (self._rootfilename))
-        self._rootfile.Close()
+        backend = getattr(self, "_backend", None)
+        if backend is None:
+            return
+        try:
+            backend.close()
+        except Exception:
+            pass
@@ -1,17 +1,28 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import collections
 import logging
-import ROOT
 import copy
 
+from . import backends
+from . import hist_arrays
+from . import histogram_stream
+from . import prefetch
+from . import profiling
+
 logger = logging.getLogger(__name__)
 
 
 class Rootfile_parser(object):
-    def __init__(self, inputrootfilename, analysis, epoch, variable, mass):
+    # arguments of get, as found by iter_histograms
+    Key = collections.namedtuple("Key", ["channel", "category", "process"])
+
+    def __init__(
+        self, inputrootfilename, analysis, epoch, variable, mass, backend=None
+    ):
         self._rootfilename = inputrootfilename
-        self._rootfile = ROOT.TFile(self._rootfilename, "READ")
+        self._backend = backends.open_backend(self._rootfilename, backend)
         self._type = "control"
         self._analysis = analysis
         self._epoch = epoch
@@ -20,9 +31,13 @@ class Rootfile_parser(object):
 
     @property
     def rootfile(self):
-        return self._rootfile
+        return self._backend.rootfile
 
-    def get(self, channel, category, process):
+    @property
+    def backend(self):
+        return self._backend
+
+    def _hist_path(self, channel, category, process):
         hist_hash = "#{channel}#{category}#{process}#{analysis}#{epoch}#{variable}#{mass}#".format(
             channel=channel,
             category=category,
@@ -33,30 +48,61 @@ class Rootfile_parser(object):
             mass=self._mass,
         )
         logger.debug("Try to access %s in %s" % (hist_hash, self._rootfilename))
-        print("rootfile: ", self._rootfile.Get(hist_hash), " hash: ", hist_hash)
+        return hist_hash
+
+    @profiling.timed()
+    def get(self, channel, category, process):
+        return self._backend.get(self._hist_path(channel, category, process))
+
+    # reads the histograms of the keys, tuples or dicts of arguments of get, into
+    # the histogram cache in the background, see prefetch.Prefetcher
+    def prefetch(self, keys, prefetcher=None):
+        prefetcher = prefetch.prefetcher if prefetcher is None else prefetcher
+        prefetcher.submit(self, keys)
+
+    # walks all histograms of the analysis, epoch, variable and mass of the parser
+    # once in on-disk order, see rootfile_parser.Rootfile_parser.iter_histograms
+    def iter_histograms(self, prefetch=0):
+        return histogram_stream.stream(self._iter_items(), prefetch, self._backend)
 
-        return self._rootfile.Get(hist_hash)
+    def _iter_items(self):
+        index = self._backend.index
+        selection = [self._analysis, self._epoch, self._variable, str(self._mass)]
+        for name in index.keys():
+            parts = name.split("#")
+            if len(parts) != 9 or parts[4:8] != selection:
+                continue
+            yield histogram_stream.HistogramItem(
+                self.Key(*parts[1:4]), name, self._backend
+            )
 
     def list_contents(self):
-        return [key.GetTitle() for key in self._rootfile.GetListOfKeys()]
-
-    def get_bins(self, channel, category):
-        hist = self.get(channel, category)
-        nbins = hist.GetNbinsX()
-        bins = []
-        for i in range(nbins):
-            bins.append(hist.GetBinLowEdge(i + 1))
-        bins.append(hist.GetBinLowEdge(i + 1) + hist.GetBinWidth(i + 1))
-        return bins
-
-    def get_values(self, channel, category):
-        hist = self.get(channel, category)
-        nbins = hist.GetNbinsX()
-        values = []
-        for i in range(nbins):
-            values.append(hist.GetBinContent(i + 1))
-        return values
+        return self._backend.key_titles()
+
+    # returns NumPy arrays copied from the histogram buffers, or read from the
+    # file if the backend does not use ROOT, stacked
+    # if a list of processes is given
+    @profiling.timed()
+    def get_arrays(self, channel, category, process):
+        if isinstance(process, list):
+            return hist_arrays.stack(
+                [self.get_arrays(channel, category, p) for p in process]
+            )
+        return self._backend.arrays(self._hist_path(channel, category, process))
+
+    def get_bins(self, channel, category, process):
+        return self.get_arrays(channel, category, process).edges.tolist()
+
+    def get_values(self, channel, category, process):
+        return self.get_arrays(channel, category, process).contents.tolist()
 
+    # the backend is missing if the constructor failed, and at interpreter exit
+    # the modules needed to close it may already be torn down
     def __del__(self):
-        logger.debug("Closing rootfile %s" % (self._rootfilename))
-        self._rootfile.Close()
+        backend = getattr(self, "_backend", None)
+        if backend is None:
+            return
+        try:
+            backend.close()
+        except Exception:
+            pass
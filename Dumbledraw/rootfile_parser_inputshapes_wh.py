@@ -1,10 +1,17 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import collections
 import logging
-import ROOT
 import copy
 
+from . import backends
+from . import hist_arrays
+from . import histogram_stream
+from . import key_resolver
+from . import prefetch
+from . import profiling
+
 logger = logging.getLogger(__name__)
 import yaml
 
@@ -66,55 +73,99 @@ class Rootfile_parser(object):
         "QCD": "QCDMC",
     }
 
-    def __init__(self, inputrootfilename, variable):
+    # arguments of get, as found by iter_histograms
+    Key = collections.namedtuple(
+        "Key", ["channel", "process", "category", "shape_type"]
+    )
+
+    def __init__(self, inputrootfilename, variable, backend=None):
         self._rootfilename = inputrootfilename
-        self._rootfile = ROOT.TFile(self._rootfilename, "READ")
+        self._backend = backends.open_backend(self._rootfilename, backend)
         self._variable = variable
+        self._resolver = None
 
     @property
     def rootfile(self):
-        return self._rootfile
+        return self._backend.rootfile
 
-    def get(self, channel, process, category=None, shape_type="Nominal"):
-        dataset = self._dataset_map[process]
-        if category is None:
-            category = "" if "data" in process else "-" + self._process_map[process]
-        else:
-            category = (
-                "-" + category
-                if "data" in process
-                else "-" + "-".join([self._process_map[process], category])
+    @property
+    def backend(self):
+        return self._backend
+
+    # table of the keys of the variable, built on first use
+    @property
+    def resolver(self):
+        if self._resolver is None:
+            self._resolver = key_resolver.Key_resolver(
+                self._backend.index.keys(),
+                self._dataset_map,
+                self._process_map,
+                self._variable,
             )
-        hist_hash = "{dataset}#{channel}{category}#{shape_type}#{variable}".format(
-            dataset=dataset,
-            channel=channel,
-            category=category,
-            shape_type=shape_type,
-            variable=self._variable,
-        )
+        return self._resolver
+
+    def _hist_path(self, channel, process, category=None, shape_type="Nominal"):
+        hist_hash = self.resolver.resolve(channel, process, category, shape_type)
         logger.debug("Try to access %s in %s" % (hist_hash, self._rootfilename))
-        return self._rootfile.Get(hist_hash)
+        return hist_hash
+
+    @profiling.timed()
+    def get(self, channel, process, category=None, shape_type="Nominal"):
+        return self._backend.get(
+            self._hist_path(channel, process, category, shape_type)
+        )
+
+    # reads the histograms of the keys, tuples or dicts of arguments of get, into
+    # the histogram cache in the background, see prefetch.Prefetcher
+    def prefetch(self, keys, prefetcher=None):
+        prefetcher = prefetch.prefetcher if prefetcher is None else prefetcher
+        prefetcher.submit(self, keys)
+
+    # walks all histograms of the variable of the parser once in on-disk order, see
+    # rootfile_parser.Rootfile_parser.iter_histograms
+    def iter_histograms(self, prefetch=0):
+        return histogram_stream.stream(self._iter_items(), prefetch, self._backend)
+
+    def _iter_items(self):
+        for name, fields in self.resolver.items():
+            yield histogram_stream.HistogramItem(self.Key(*fields), name, self._backend)
 
     def list_contents(self):
-        return [key.GetTitle() for key in self._rootfile.GetListOfKeys()]
-
-    def get_bins(self, channel, category):
-        hist = self.get(channel, category)
-        nbins = hist.GetNbinsX()
-        bins = []
-        for i in range(nbins):
-            bins.append(hist.GetBinLowEdge(i + 1))
-        bins.append(hist.GetBinLowEdge(i + 1) + hist.GetBinWidth(i + 1))
-        return bins
-
-    def get_values(self, channel, category):
-        hist = self.get(channel, category)
-        nbins = hist.GetNbinsX()
-        values = []
-        for i in range(nbins):
-            values.append(hist.GetBinContent(i + 1))
-        return values
+        return self._backend.key_titles()
+
+    # returns NumPy arrays copied from the histogram buffers, or read from the
+    # file if the backend does not use ROOT. If a list of processes and/or shape
+    # types is given, the arrays of all combinations are stacked with the shape
+    # types varying fastest.
+    @profiling.timed()
+    def get_arrays(self, channel, process, category=None, shape_type="Nominal"):
+        if isinstance(process, list) or isinstance(shape_type, list):
+            processes = process if isinstance(process, list) else [process]
+            shape_types = shape_type if isinstance(shape_type, list) else [shape_type]
+            return hist_arrays.stack(
+                [
+                    self.get_arrays(channel, p, category, s)
+                    for p in processes
+                    for s in shape_types
+                ]
+            )
+        return self._backend.arrays(
+            self._hist_path(channel, process, category, shape_type)
+        )
+
+    def get_bins(self, channel, process, category=None, shape_type="Nominal"):
+        return self.get_arrays(channel, process, category, shape_type).edges.tolist()
+
+    def get_values(self, channel, process, category=None, shape_type="Nominal"):
+        return self.get_arrays(channel, process, category, shape_type).contents.tolist()
 
+    # the backend is missing if the constructor failed, and at interpreter exit
+    # the modules needed to close it may already be torn down
     def __del__(self):
-        logger.debug("Closing rootfile %s" % (self._rootfilename))
-        self._rootfile.Close()
+        backend = getattr(self, "_backend", None)
+        if backend is None:
+            return
+        try:
+            backend.close()
+        except Exception:
+            pass
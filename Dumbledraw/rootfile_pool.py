@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import atexit
+import collections
+import logging
+import os
+import threading
+
+from . import rootfile_index
+
+logger = logging.getLogger(__name__)
+
+# held while reading from a ROOT file, which must not be read by several threads
+# at once
+read_lock = threading.RLock()
+
+
+# keeps every ROOT file open only once per process. Handles are reference counted
+# by the parsers using them; unused handles stay open for later parsers until more
+# than max_open_files are open, in which case the least recently used are closed.
+class Rootfile_pool(object):
+    def __init__(self, max_open_files=64):
+        self._max_open_files = max_open_files
+        self._handles = collections.OrderedDict()
+        self._closed = False  # set by close_all until a file is acquired again
+
+    @property
+    def max_open_files(self):
+        return self._max_open_files
+
+    def set_max_open_files(self, max_open_files):
+        self._max_open_files = max_open_files
+        self._close_unused()
+
+    def __len__(self):
+        return len(self._handles)
+
+    def acquire(self, filename):
+        path = os.path.realpath(filename)
+        signature = rootfile_index.file_signature(filename)
+        entry = self._handles.get(path)
+        if entry is not None and entry["refcount"] == 0:
+            if entry["signature"] != signature:
+                logger.debug("Reopening modified rootfile %s" % filename)
+                self._close(path)
+                entry = None
+        if entry is None:
+            import ROOT
+
+            logger.debug("Opening rootfile %s" % filename)
+            rootfile = ROOT.TFile.Open(filename, "READ")
+            if not rootfile or rootfile.IsZombie():
+                logger.fatal("Cannot open rootfile %s!" % filename)
+                raise Exception
+            entry = {"rootfile": rootfile, "refcount": 0, "signature": signature}
+            self._handles[path] = entry
+        self._closed = False
+        entry["refcount"] += 1
+        self._handles.move_to_end(path)
+        self._close_unused()
+        return entry["rootfile"]
+
+    def release(self, filename):
+        path = os.path.realpath(filename)
+        entry = self._handles.get(path)
+        if entry is None and self._closed:
+            return  # e.g. parsers collected at interpreter exit after close_all
+        if entry is None or entry["refcount"] == 0:
+            logger.warning("Released rootfile %s which is not in use" % filename)
+            return
+        entry["refcount"] -= 1
+        self._close_unused()
+
+    def _close(self, path):
+        entry = self._handles.pop(path)
+        logger.debug("Closing rootfile %s" % path)
+        entry["rootfile"].Close()
+
+    def _close_unused(self):
+        if len(self._handles) <= self._max_open_files:
+            return
+        for path in [p for p, e in self._handles.items() if e["refcount"] == 0]:
+            self._close(path)
+            if len(self._handles) <= self._max_open_files:
+                return
+        logger.warning(
+            "%d rootfiles are in use, exceeding the limit of %d open files"
+            % (len(self._handles), self._max_open_files)
+        )
+
+    # closes all files, also those still in use. Releasing them afterwards is
+    # ignored, since atexit runs before parsers kept in globals are collected.
+    def close_all(self):
+        for path in list(self._handles.keys()):
+            self._close(path)
+        self._closed = True
+
+
+# pool shared by all parser instances of this process
+rootfile_pool = Rootfile_pool()
+atexit.register(rootfile_pool.close_all)
@@ -1,18 +1,27 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import collections
 import logging
-import ROOT
 import copy
 
+from . import backends
+from . import hist_arrays
+from . import histogram_stream
+from . import prefetch
+from . import profiling
+
 logger = logging.getLogger(__name__)
 
 
 class ScaleFactor_Rootfile_parser(object):
-    def __init__(self, inputrootfilename):
+    # arguments of get, as found by iter_histograms
+    Key = collections.namedtuple("Key", ["variable", "etabin"])
+
+    def __init__(self, inputrootfilename, backend=None):
         self._rootfilename = inputrootfilename
-        self._rootfile = ROOT.TFile(self._rootfilename, "READ")
-        content = [entry.GetName() for entry in self._rootfile.GetListOfKeys()]
+        self._backend = backends.open_backend(self._rootfilename, backend)
+        content = self._backend.key_titles()
         self.Nbins = len(content)
         logger.debug(
             "Identified {} histograms in rootfile {} ".format(
@@ -23,46 +32,70 @@ class ScaleFactor_Rootfile_parser(object):
 
     @property
     def rootfile(self):
-        return self._rootfile
+        return self._backend.rootfile
 
-    def get(self, variable, etabin):
+    @property
+    def backend(self):
+        return self._backend
+
+    # reads the histograms of the keys, tuples or dicts of arguments of get, into
+    # the histogram cache in the background, see prefetch.Prefetcher
+    def prefetch(self, keys, prefetcher=None):
+        prefetcher = prefetch.prefetcher if prefetcher is None else prefetcher
+        prefetcher.submit(self, keys)
+
+    # walks all histograms of the file once in on-disk order, see
+    # rootfile_parser.Rootfile_parser.iter_histograms
+    def iter_histograms(self, prefetch=0):
+        return histogram_stream.stream(self._iter_items(), prefetch, self._backend)
+
+    def _iter_items(self):
+        index = self._backend.index
+        for name in index.keys():
+            variable, separator, etabin = name.partition("_projx_")
+            if separator == "":
+                continue
+            yield histogram_stream.HistogramItem(
+                self.Key(variable, etabin), name, self._backend
+            )
+
+    def _hist_path(self, variable, etabin):
         hist_hash = self._hist_hash.format(variable=variable, etabin=etabin)
         logger.debug("Try to access %s in %s" % (hist_hash, self._rootfilename))
-        return self._rootfile.Get(hist_hash)
+        return hist_hash
+
+    @profiling.timed()
+    def get(self, variable, etabin):
+        return self._backend.get(self._hist_path(variable, etabin))
+
+    # returns NumPy arrays copied from the histogram buffers, or read from the
+    # file if the backend does not use ROOT, stacked
+    # if a list of eta bins is given
+    @profiling.timed()
+    def get_arrays(self, variable, etabin):
+        if isinstance(etabin, list):
+            return hist_arrays.stack([self.get_arrays(variable, e) for e in etabin])
+        return self._backend.arrays(self._hist_path(variable, etabin))
 
     def get_bins(self, variable, etabin):
-        hist = self.get(self, variable, etabin)
-        nbins = hist.GetNbinsX()
-        bins = []
-        for i in range(nbins):
-            bins.append(hist.GetBinLowEdge(i + 1))
-        bins.append(hist.GetBinLowEdge(i + 1) + hist.GetBinWidth(i + 1))
-        return bins
+        return self.get_arrays(variable, etabin).edges.tolist()
 
     def get_values(self, variable, etabin):
-        hist = self.get(self, variable, etabin)
-        nbins = hist.GetNbinsX()
-        values = []
-        for i in range(nbins):
-            values.append(hist.GetBinContent(i + 1))
-        return values
+        return self.get_arrays(variable, etabin).contents.tolist()
 
     def get_values_up(self, variable, etabin):
-        hist = self.get(self, variable, etabin)
-        nbins = hist.GetNbinsX()
-        values = []
-        for i in range(nbins):
-            values.append(hist.GetBinErrDown(i + 1))
-        return values
+        return self.get_arrays(variable, etabin).errors_up.tolist()
 
     def get_values_down(self, variable, etabin):
-        hist = self.get(self, variable, etabin)
-        nbins = hist.GetNbinsX()
-        values = []
-        for i in range(nbins):
-            values.append(hist.GetBinErrDown(i + 1))
-        return values
+        return self.get_arrays(variable, etabin).errors_down.tolist()
 
+    # the backend is missing if the constructor failed, and at interpreter exit
+    # the modules needed to close it may already be torn down
     def __del__(self):
-        logger.debug("Closing rootfile %s" % (self._rootfilename))
-        self._rootfile.Close()
+        backend = getattr(self, "_backend", None)
+        if backend is None:
+            return
+        try:
+            backend.close()
+        except Exception:
+            pass
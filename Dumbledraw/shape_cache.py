@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import collections
+import hashlib
+import json
+import logging
+import os
+
+import numpy as np
+
+from . import hist_arrays
+from . import rootfile_index
+
+logger = logging.getLogger(__name__)
+
+# Columnar copy of all 1D histograms of a shape file, used by the cache backend of
+# the parsers to skip reading ROOT files when the same inputs are plotted again.
+# The cache is a directory with two files:
+#
+#   values.npy  all histograms as one float64 array, each stored as edges (n + 1),
+#               contents, errors up, errors down (n each), underflow and overflow
+#   index.json  signature of the shape file, key index of the shape file and
+#               path -> [offset, number of bins, title] of every histogram
+#
+# values.npy is memory mapped, so reading a histogram only slices the mapping.
+
+_version = 1
+
+Cached_shape = collections.namedtuple("Cached_shape", ["name", "title", "arrays"])
+
+
+# the cache is stored next to the shape file or, if DUMBLEDRAW_CACHE_DIR is set,
+# in that directory
+def cache_path(filename):
+    if os.environ.get("DUMBLEDRAW_CACHE_DIR"):
+        return os.path.join(
+            os.environ["DUMBLEDRAW_CACHE_DIR"],
+            "%s_%s.shapecache"
+            % (
+                os.path.basename(filename),
+                hashlib.md5(os.path.abspath(filename).encode()).hexdigest(),
+            ),
+        )
+    return filename + ".shapecache"
+
+
+class Shape_cache(object):
+    def __init__(self, path):
+        self._path = path
+        with open(os.path.join(path, "index.json")) as index_file:
+            content = json.load(index_file)
+        if content.get("version") != _version:
+            logger.fatal("Unsupported shape cache version in %s!" % path)
+            raise Exception
+        self._signature = content["signature"]
+        self._directories = content["directories"]
+        self._titles = content["titles"]
+        self._histograms = content["histograms"]
+        self._values = np.load(os.path.join(path, "values.npy"), mmap_mode="r")
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def signature(self):
+        return self._signature
+
+    @property
+    def directories(self):
+        return self._directories
+
+    @property
+    def titles(self):
+        return self._titles
+
+    def contains(self, path):
+        return path in self._histograms
+
+    # the arrays are read-only views on the memory mapped values
+    def arrays(self, path):
+        if not path in self._histograms:
+            logger.fatal("%s is not in shape cache %s!" % (path, self._path))
+            raise Exception
+        offset, nbins, _ = self._histograms[path]
+        values = self._values[offset : offset + 4 * nbins + 3]
+        return hist_arrays.HistArrays(
+            edges=values[: nbins + 1],
+            contents=values[nbins + 1 : 2 * nbins + 1],
+            errors_up=values[2 * nbins + 1 : 3 * nbins + 1],
+            errors_down=values[3 * nbins + 1 : 4 * nbins + 1],
+            underflow=values[4 * nbins + 1],
+            overflow=values[4 * nbins + 2],
+        )
+
+    def load(self, path):
+        arrays = self.arrays(path)
+        return Cached_shape(path.split("/")[-1], self._histograms[path][2], arrays)
+
+    def close(self):
+        self._values = None
+
+
+# creates a TH1D from a cached shape. Asymmetric errors are not kept, the errors
+# of the histogram are set to the upward errors.
+def to_root(shape):
+    import ROOT
+
+    arrays = shape.arrays
+    nbins = len(arrays.contents)
+    edges = np.array(arrays.edges, dtype=np.float64)
+    hist = ROOT.TH1D(shape.name, shape.title, nbins, edges)
+    hist.SetDirectory(0)
+    ROOT.SetOwnership(hist, True)
+    hist_arrays.fill(hist, arrays)
+    return hist
+
+
+# writes the cache of all 1D histograms of the shape file, read with the given
+# backend (see backends.py), and returns its path
+def export(filename, path=None, backend="root"):
+    from . import backends
+
+    path = cache_path(filename) if path is None else path
+    signature = rootfile_index.file_signature(filename)
+    reader = backends.open_backend(filename, backend)
+    histograms = {}
+    chunks = []
+    offset = 0
+    try:
+        index = reader.index
+        for directory in index.directories():
+            for name in index.keys(directory):
+                key_path = name if directory == "" else directory + "/" + name
+                if index.has_directory(key_path):
+                    continue
+                hist = reader.load(key_path)
+                if not reader.is_histogram(hist):
+                    logger.debug("Skipping %s, which is no 1D histogram" % key_path)
+                    continue
+                arrays = reader.to_arrays(hist)
+                nbins = len(arrays.contents)
+                chunks.append(
+                    np.concatenate(
+                        [
+                            arrays.edges,
+                            arrays.contents,
+                            arrays.errors_up,
+                            arrays.errors_down,
+                            [arrays.underflow, arrays.overflow],
+                        ]
+                    ).astype(np.float64)
+                )
+                histograms[key_path] = [offset, nbins, reader.title(hist)]
+                offset += 4 * nbins + 3
+        directories = {
+            directory: index.keys(directory) for directory in index.directories()
+        }
+        titles = reader.key_titles()
+    finally:
+        reader.close()
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    # the index is replaced last, an interrupted export leaves an outdated cache
+    values_path = os.path.join(path, "values.npy")
+    with open(values_path + ".tmp", "wb") as values_file:
+        np.save(values_file, np.concatenate(chunks) if chunks else np.zeros(0))
+    os.replace(values_path + ".tmp", values_path)
+    index_path = os.path.join(path, "index.json")
+    with open(index_path + ".tmp", "w") as index_file:
+        json.dump(
+            {
+                "version": _version,
+                "signature": signature,
+                "directories": directories,
+                "titles": titles,
+                "histograms": histograms,
+            },
+            index_file,
+        )
+    os.replace(index_path + ".tmp", index_path)
+    logger.info(
+        "Exported %d histograms of %s to %s" % (len(histograms), filename, path)
+    )
+    return path
+
+
+# opens the cache of the shape file, which is exported first if it does not exist
+# or is outdated
+def open_cache(filename, backend="root"):
+    path = cache_path(filename)
+    if os.path.exists(os.path.join(path, "index.json")):
+        try:
+            cache = Shape_cache(path)
+        except Exception:
+            logger.warning("Ignoring unreadable shape cache %s" % path)
+        else:
+            if cache.signature == rootfile_index.file_signature(filename):
+                logger.debug("Read shape cache %s" % path)
+                return cache
+            logger.debug("Shape cache %s is outdated" % path)
+            cache.close()
+    return Shape_cache(export(filename, path, backend))
+
+
+# exports the caches of the given shape files ahead of plotting, e.g.
+#   python -m Dumbledraw.shape_cache shapes.root --backend uproot
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Export shape files to the columnar shape cache."
+    )
+    parser.add_argument("files", nargs="+", help="Shape files to export.")
+    parser.add_argument(
+        "--backend",
+        default="root",
+        choices=["root", "uproot"],
+        help="Backend used to read the shape files.",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    for filename in args.files:
+        export(filename, backend=args.backend)
@@ -1,15 +1,28 @@
 import ROOT as R
+import hashlib
 import logging
+import os
+import pickle
 import yaml
 
 logger = logging.getLogger(__name__)
 
 COL_STORE = []
-labels_path = "Dumbledraw/Dumbledraw/labels.yaml"
-colors_path = "Dumbledraw/Dumbledraw/colors.yaml"
+_transparent_colors = {}  # (color, alpha) -> index of the transparent color
+labels_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "labels.yaml")
+colors_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "colors.yaml")
 
+# parsed yaml files and dictionaries created on first access
+_yaml_store = {}
+_color_dict = None
 
+
+# returns the index of a transparent version of the given color. Every combination
+# of color and alpha is registered only once per process.
 def CreateTransparentColor(color, alpha):
+    key = (color, alpha)
+    if key in _transparent_colors:
+        return _transparent_colors[key]
     adapt = R.gROOT.GetColor(color)
     new_idx = R.gROOT.GetListOfColors().GetLast() + 1
     trans = R.TColor(
@@ -17,11 +30,93 @@ def CreateTransparentColor(color, alpha):
     )
     COL_STORE.append(trans)
     trans.SetName("userColor%i" % new_idx)
+    _transparent_colors[key] = new_idx
     return new_idx
 
 
+# TLatex objects drawn on the pads of a plot. In contrast to TLatex::DrawLatex,
+# which creates a new object for every text, the drawn objects are kept by the pool
+# and reused once the pads of the plot are cleared and release is called.
+class TextPool(object):
+    def __init__(self):
+        self._free = []
+        self._used = []
+
+    def __len__(self):
+        return len(self._free) + len(self._used)
+
+    # draws a copy of latex with its text attributes into the current pad
+    def DrawLatex(self, latex, x, y, text):
+        drawn = self._free.pop() if self._free else R.TLatex()
+        latex.Copy(drawn)
+        drawn.SetX(x)
+        drawn.SetY(y)
+        drawn.SetTitle(text)
+        drawn.Draw()
+        self._used.append(drawn)
+        return drawn
+
+    # makes all drawn objects available again, the pads must be cleared before
+    def release(self):
+        self._free.extend(self._used)
+        self._used = []
+
+    def clear(self):
+        self._free = []
+        self._used = []
+
+
+# draws the text with the attributes of latex, using the pool if one is given
+def DrawLatex(latex, x, y, text, text_pool=None):
+    if text_pool is None:
+        return latex.DrawLatex(x, y, text)
+    return text_pool.DrawLatex(latex, x, y, text)
+
+
+# parses a yaml file at most once per process. If the environment variable
+# DUMBLEDRAW_CACHE_DIR is set, the parsed content is additionally stored there as
+# pickle, which is reused by later processes as long as the yaml file is unchanged.
+def load_yaml(path):
+    if path in _yaml_store:
+        return _yaml_store[path]
+    stat = os.stat(path)
+    signature = (stat.st_size, stat.st_mtime_ns)
+    cache_path = None
+    if os.environ.get("DUMBLEDRAW_CACHE_DIR"):
+        cache_path = os.path.join(
+            os.environ["DUMBLEDRAW_CACHE_DIR"],
+            "%s_%s.pkl"
+            % (
+                os.path.basename(path),
+                hashlib.md5(os.path.abspath(path).encode()).hexdigest(),
+            ),
+        )
+    content = None
+    if cache_path is not None and os.path.exists(cache_path):
+        try:
+            with open(cache_path, "rb") as cache_file:
+                cached_signature, cached_content = pickle.load(cache_file)
+            if cached_signature == signature:
+                content = cached_content
+        except Exception as error:
+            logger.debug("Ignoring unreadable cache %s: %s" % (cache_path, error))
+    if content is None:
+        with open(path) as yaml_file:
+            content = yaml.safe_load(yaml_file)
+        if cache_path is not None:
+            try:
+                if not os.path.isdir(os.path.dirname(cache_path)):
+                    os.makedirs(os.path.dirname(cache_path))
+                with open(cache_path, "wb") as cache_file:
+                    pickle.dump((signature, content), cache_file)
+            except (IOError, OSError) as error:
+                logger.debug("Cannot write cache %s: %s" % (cache_path, error))
+    _yaml_store[path] = content
+    return content
+
+
 def load_colors(colors_path):
-    color_dict = yaml.safe_load(open(colors_path))["colors"]
+    color_dict = dict(load_yaml(colors_path)["colors"])
     for key, value in color_dict.items():
         if isinstance(value, str):
             color_dict[key] = R.TColor.GetColor(value)
@@ -31,10 +126,32 @@ def load_colors(colors_path):
     return color_dict
 
 
-legend_label_dict = yaml.safe_load(open(labels_path))["legend_label"]
-x_label_dict = yaml.safe_load(open(labels_path))["x_label"]
+def get_legend_label_dict():
+    return load_yaml(labels_path)["legend_label"]
+
+
+def get_x_label_dict():
+    return load_yaml(labels_path)["x_label"]
 
-color_dict = load_colors(colors_path)
+
+# the ROOT colors are registered on first access
+def get_color_dict():
+    global _color_dict
+    if _color_dict is None:
+        _color_dict = load_colors(colors_path)
+    return _color_dict
+
+
+# keeps styles.legend_label_dict, styles.x_label_dict and styles.color_dict
+# available as module attributes while loading them lazily
+def __getattr__(name):
+    if name == "legend_label_dict":
+        return get_legend_label_dict()
+    if name == "x_label_dict":
+        return get_x_label_dict()
+    if name == "color_dict":
+        return get_color_dict()
+    raise AttributeError("module %s has no attribute %s" % (__name__, name))
 
 
 def SetStyle(name, **kwargs):
@@ -247,7 +364,7 @@ def ModTDRStyle(width=600, height=600, t=0.06, b=0.12, l=0.16, r=0.04):
     R.TGaxis.SetExponentOffset(-0.07, 0.0, "y")
 
 
-def DrawText(pad, text, scale_text_size, pos, angle, custom_pos=None):
+def DrawText(pad, text, scale_text_size, pos, angle, custom_pos=None, text_pool=None):
     pad.cd()
     left_border = pad.GetLeftMargin()
     right_border = 1.0 - pad.GetRightMargin()
@@ -273,14 +390,14 @@ def DrawText(pad, text, scale_text_size, pos, angle, custom_pos=None):
             x_pos = left_border + (0.07 + (pos % 3) * 0.43) * (
                 right_border - left_border
             )
-            y_pos = top_border + (0.07 + (pos / 3) * 0.43) * (
+            y_pos = top_border + (0.07 + (pos // 3) * 0.43) * (
                 bottom_border - top_border
             )
-            alignment = 10 * ((pos % 3) + 1) + 3 - (pos / 3)
+            alignment = 10 * ((pos % 3) + 1) + 3 - (pos // 3)
             if angle == 90:
-                alignment = 10 * (alignment % 10) + 4 - alignment / 10
+                alignment = 10 * (alignment % 10) + 4 - alignment // 10
             elif angle == 270 or angle == -90:
-                alignment = 40 - 10 * (alignment % 10) + alignment / 10
+                alignment = 40 - 10 * (alignment % 10) + alignment // 10
         else:
             logger.fatal("DrawText: pos must be in range [1 ... 9]")
             raise Exception
@@ -292,7 +409,7 @@ def DrawText(pad, text, scale_text_size, pos, angle, custom_pos=None):
     latex.SetTextFont(42)
     latex.SetTextColor(R.kBlack)
     latex.SetTextSize(0.04 * scale_text_size)
-    latex.DrawLatex(x_pos, y_pos, text)
+    DrawLatex(latex, x_pos, y_pos, text, text_pool)
 
 
 def DrawCMSLogo(
@@ -308,6 +425,7 @@ def DrawCMSLogo(
     extraTextFont=52,
     cmsTextSize=0.8,
     thesisstyle=False,
+    text_pool=None,
 ):
     """Blah
 
@@ -381,7 +499,7 @@ def DrawCMSLogo(
         latex.SetTextFont(cmsTextFont)
         latex.SetTextAlign(11)
         latex.SetTextSize(cmsTextSize * t * pad_ratio)
-        latex.DrawLatex(l, 1 - t + lumiTextOffset * t, cmsText)
+        DrawLatex(latex, l, 1 - t + lumiTextOffset * t, cmsText, text_pool)
 
     posX_ = 0
     if iPosX % 10 <= 1:
@@ -397,31 +515,45 @@ def DrawCMSLogo(
             latex.SetTextFont(cmsTextFont)
             latex.SetTextSize(cmsTextSize * t * pad_ratio)
             latex.SetTextAlign(align_)
-            latex.DrawLatex(posX_, posY_, cmsText)
+            DrawLatex(latex, posX_, posY_, cmsText, text_pool)
             latex.SetTextFont(42)
             latex.SetTextAlign(align_)
             latex.SetTextSize(extraTextSize * t * pad_ratio)
             if pad_ratio_raw > 0.8:
-                latex.DrawLatex(
-                    l + (relPosX + 0.081) * (1 - l - r), posY_ - 0.007, "data"
+                DrawLatex(
+                    latex,
+                    l + (relPosX + 0.081) * (1 - l - r),
+                    posY_ - 0.007,
+                    "data",
+                    text_pool,
                 )
             if pad_ratio_raw < 0.8:
-                latex.DrawLatex(
-                    l + (relPosX + 0.065) * (1 - l - r), posY_ - 0.007, "data"
+                DrawLatex(
+                    latex,
+                    l + (relPosX + 0.065) * (1 - l - r),
+                    posY_ - 0.007,
+                    "data",
+                    text_pool,
                 )
         else:
             latex.SetTextFont(cmsTextFont)
             latex.SetTextSize(cmsTextSize * t * pad_ratio)
             latex.SetTextAlign(align_)
-            latex.DrawLatex(posX_, posY_, cmsText)
+            DrawLatex(latex, posX_, posY_, cmsText, text_pool)
         if writeExtraText:
             latex.SetTextFont(extraTextFont)
             latex.SetTextAlign(align_)
             latex.SetTextSize(extraTextSize * t * pad_ratio)
-            latex.DrawLatex(posX_, posY_ - relExtraDY * cmsTextSize * t, extraText)
+            DrawLatex(
+                latex, posX_, posY_ - relExtraDY * cmsTextSize * t, extraText, text_pool
+            )
             if writeExtraText2:
-                latex.DrawLatex(
-                    posX_, posY_ - 1.8 * relExtraDY * cmsTextSize * t, extraText2
+                DrawLatex(
+                    latex,
+                    posX_,
+                    posY_ - 1.8 * relExtraDY * cmsTextSize * t,
+                    extraText2,
+                    text_pool,
                 )
     elif writeExtraText:
         if iPosX == 0:
@@ -430,10 +562,10 @@ def DrawCMSLogo(
         latex.SetTextFont(extraTextFont)
         latex.SetTextSize(extraTextSize * t * pad_ratio)
         latex.SetTextAlign(align_)
-        latex.DrawLatex(posX_, posY_, extraText)
+        DrawLatex(latex, posX_, posY_, extraText, text_pool)
 
 
-def DrawTitle(pad, text, align, textSize=0.6, textfont=42):
+def DrawTitle(pad, text, align, textSize=0.6, textfont=42, text_pool=None):
     pad_backup = R.gPad
     pad.cd()
     t = pad.GetTopMargin()
@@ -459,13 +591,13 @@ def DrawTitle(pad, text, align, textSize=0.6, textfont=42):
     if align == 1:
         latex.SetTextAlign(11)
     if align == 1:
-        latex.DrawLatex(l, y_off, text)
+        DrawLatex(latex, l, y_off, text, text_pool)
     if align == 2:
         latex.SetTextAlign(21)
     if align == 2:
-        latex.DrawLatex(l + (1 - l - r) * 0.5, y_off, text)
+        DrawLatex(latex, l + (1 - l - r) * 0.5, y_off, text, text_pool)
     if align == 3:
         latex.SetTextAlign(31)
     if align == 3:
-        latex.DrawLatex(1 - r, y_off, text)
+        DrawLatex(latex, 1 - r, y_off, text, text_pool)
     pad_backup.cd()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Vectorized systematic uncertainty bands from the variations returned by
+# Rootfile_parser.get_variations:
+#
+#   processes = ["ZTT", "ZL", "TTT"]
+#   nominal = rootfile.get_arrays(era, channel, category, processes).contents
+#   variations = rootfile.get_variations(era, channel, category, processes, systs)
+#   up, down = uncertainties.syst_band(nominal, variations)
+#
+# nominal has the shape [process, bin], variations [process, systematic, 2, bin].
+
+
+# shifts of the sum of the processes for every systematic, shape [systematic, 2, bin]
+def syst_shifts(nominal, variations):
+    nominal = np.asarray(nominal, dtype=np.float64)
+    variations = np.asarray(variations, dtype=np.float64)
+    if nominal.ndim == 1:
+        nominal = nominal[np.newaxis, :]
+    if variations.ndim == 3:
+        variations = variations[np.newaxis, ...]
+    if variations.shape[0] != nominal.shape[0] or variations.shape[-1] != (
+        nominal.shape[-1]
+    ):
+        logger.fatal(
+            "Variations of shape %s do not match nominal contents of shape %s!"
+            % (variations.shape, nominal.shape)
+        )
+        raise Exception
+    return variations.sum(axis=0) - nominal.sum(axis=0)
+
+
+# upward and downward uncertainties adding the systematics in quadrature. The
+# larger positive shift of a systematic enters the upward uncertainty, the larger
+# negative shift the downward uncertainty.
+def quadrature(shifts):
+    up = np.clip(shifts, 0.0, None).max(axis=1)
+    down = np.clip(shifts, None, 0.0).min(axis=1)
+    return (
+        np.sqrt(np.sum(np.square(up), axis=0)),
+        np.sqrt(np.sum(np.square(down), axis=0)),
+    )
+
+
+# upward and downward uncertainties given by the largest shifts of all systematics
+def envelope(shifts):
+    shifts = shifts.reshape((-1, shifts.shape[-1]))
+    return (
+        np.clip(shifts.max(axis=0), 0.0, None),
+        -np.clip(shifts.min(axis=0), None, 0.0),
+    )
+
+
+band_methods = {"quadrature": quadrature, "envelope": envelope}
+
+
+# upward and downward systematic uncertainties of the sum of the processes
+def syst_band(nominal, variations, method="quadrature"):
+    if not method in band_methods:
+        logger.fatal(
+            "Unknown band method %s, choose one of %s!"
+            % (method, list(band_methods.keys()))
+        )
+        raise Exception
+    return band_methods[method](syst_shifts(nominal, variations))
+
+
+# creates a graph with points at the bin centers, the uncertainties as y errors
+# and the bin widths as x errors
+def to_graph(edges, values, up, down, name="band"):
+    import ROOT
+
+    edges = np.asarray(edges, dtype=np.float64)
+    nbins = len(edges) - 1
+    centers = np.ascontiguousarray(0.5 * (edges[1:] + edges[:-1]))
+    widths = np.ascontiguousarray(0.5 * (edges[1:] - edges[:-1]))
+    graph = ROOT.TGraphAsymmErrors(
+        nbins,
+        centers,
+        np.ascontiguousarray(values, dtype=np.float64),
+        widths,
+        widths,
+        np.ascontiguousarray(down, dtype=np.float64),
+        np.ascontiguousarray(up, dtype=np.float64),
+    )
+    graph.SetName(name)
+    return graph
@@ -0,0 +1,453 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+logger = logging.getLogger("")
+
+# Measures the wall time and the peak memory of the main stages of Dumbledraw on
+# synthetic input files. Every stage runs in a fresh process, so the peak memory
+# reported for a stage is not inflated by the stages before. The results are
+# written to a json file, which can be passed as baseline to a later run:
+#
+#   python benchmarks/benchmark.py --output before.json
+#   (change the code)
+#   python benchmarks/benchmark.py --output after.json --compare before.json
+
+stages = [
+    "open_index",
+    "fetch_cold",
+    "fetch_warm",
+    "fetch_ntuple",
+    "add_hist",
+    "create_stack",
+    "draw_unrolled",
+    "save",
+]
+
+_era = "2018"
+_variable = "m_vis"
+_ntuple_processes = ["ZTT", "ZL", "ZJ", "TTT", "TTJ", "VVT", "VVJ", "W", "QCD"]
+
+
+def setup_logging(level=logging.INFO):
+    logger.setLevel(level)
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(name)s - %(levelname)s - %(message)s"))
+    logger.addHandler(handler)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the parsers and the plotting of Dumbledraw."
+    )
+    parser.add_argument(
+        "--output", default="benchmark.json", help="Output json file of the results."
+    )
+    parser.add_argument(
+        "--compare", default=None, help="Baseline json file to compare with."
+    )
+    parser.add_argument(
+        "--threshold",
+        default=0.2,
+        type=float,
+        help="Relative increase of a stage reported as regression.",
+    )
+    parser.add_argument(
+        "--workdir",
+        default=None,
+        help="Directory of the synthetic input files. Defaults to a temporary one.",
+    )
+    parser.add_argument(
+        "--stages", default=stages, nargs="+", choices=stages, help="Stages to run."
+    )
+    parser.add_argument("--repeat", default=3, type=int, help="Runs per stage.")
+    parser.add_argument(
+        "--timeout",
+        default=3600.0,
+        type=float,
+        help="Seconds after which a stage is stopped and reported as failed.",
+    )
+    parser.add_argument("--channels", default=3, type=int)
+    parser.add_argument("--categories", default=10, type=int)
+    parser.add_argument("--processes", default=10, type=int)
+    parser.add_argument("--systematics", default=20, type=int)
+    parser.add_argument("--bins", default=60, type=int)
+    parser.add_argument(
+        "--unrolled-bins", default=6, type=int, help="Number of unrolled sub-ranges."
+    )
+    return parser.parse_args()
+
+
+def _channels(config):
+    return ["ch%d" % i for i in range(config["channels"])]
+
+
+def _categories(config):
+    return ["cat%d" % i for i in range(config["categories"])]
+
+
+def _processes(config):
+    return ["proc%d" % i for i in range(config["processes"])]
+
+
+def _systematics(config):
+    return ["syst%d" % i for i in range(config["systematics"])]
+
+
+def _fill(hist, seed):
+    import ROOT as R
+
+    random = R.TRandom3(seed)
+    for i in range(1, hist.GetNbinsX() + 1):
+        value = random.Exp(100.0)
+        hist.SetBinContent(i, value)
+        hist.SetBinError(i, value**0.5)
+
+
+# writes a control shapes file with the layout of CombineHarvester:
+# htt_<channel>_<category>_<era>/<process>[_<systematic>Up/Down]
+def generate_combine_file(path, config):
+    import ROOT as R
+
+    rootfile = R.TFile(path, "RECREATE")
+    seed = 1
+    for channel in _channels(config):
+        for category in _categories(config):
+            directory = rootfile.mkdir("htt_%s_%s_%s" % (channel, category, _era))
+            directory.cd()
+            for process in _processes(config) + ["data_obs"]:
+                names = [process] + [
+                    "%s_%s%s" % (process, syst, shift)
+                    for syst in _systematics(config)
+                    for shift in ["Up", "Down"]
+                ]
+                for name in names:
+                    hist = R.TH1F(name, name, config["bins"], 0.0, 300.0)
+                    _fill(hist, seed)
+                    seed += 1
+                    hist.Write()
+                    hist.SetDirectory(0)
+    rootfile.Close()
+
+
+# writes a flat file with the keys of the ntuple processor:
+# <dataset>#<channel>-<process>-<category>#<shape type>#<variable>
+def generate_ntuple_file(path, config):
+    import ROOT as R
+    import Dumbledraw.rootfile_parser_ntuple_processor_inputshapes as ntuple_parser
+
+    parser_class = ntuple_parser.Rootfile_parser
+    rootfile = R.TFile(path, "RECREATE")
+    seed = 1
+    shape_types = ["Nominal"] + [
+        "%s%s" % (syst, shift)
+        for syst in _systematics(config)
+        for shift in ["Up", "Down"]
+    ]
+    for channel in _channels(config):
+        for category in _categories(config):
+            for process in _ntuple_processes:
+                for shape_type in shape_types:
+                    name = "%s#%s-%s-%s#%s#%s" % (
+                        parser_class._dataset_map[process],
+                        channel,
+                        parser_class._process_map[process],
+                        category,
+                        shape_type,
+                        _variable,
+                    )
+                    hist = R.TH1F(name, name, config["bins"], 0.0, 300.0)
+                    _fill(hist, seed)
+                    seed += 1
+                    hist.Write()
+                    hist.SetDirectory(0)
+    rootfile.Close()
+
+
+def _reset_caches():
+    from Dumbledraw import rootfile_index
+    from Dumbledraw.histogram_cache import histogram_cache
+    from Dumbledraw.rootfile_pool import rootfile_pool
+
+    histogram_cache.clear()
+    rootfile_pool.close_all()
+    rootfile_index._indices.clear()
+
+
+def _fetch_all(parser, config):
+    for channel in _channels(config):
+        for category in _categories(config):
+            for process in _processes(config):
+                parser.get(_era, channel, category, process)
+                for syst in _systematics(config):
+                    for shift in ["Up", "Down"]:
+                        parser.get(_era, channel, category, process, syst + shift)
+
+
+# histograms of one channel and category registered in a plot with three subplots
+def _booked_plot(parser, config, unrolled=False):
+    import Dumbledraw.dumbledraw as dd
+
+    channel = _channels(config)[0]
+    category = _categories(config)[0]
+    plot = dd.Plot([0.5, 0.3], "none")
+    processes = _processes(config)
+    for index, process in enumerate(processes + ["data_obs"]):
+        group = "data_obs" if process == "data_obs" else "bkg"
+        plot.add_hist(parser.get(_era, channel, category, process), process, group)
+        plot.setGraphStyle(process, "hist", fillcolor=2 + index % 8)
+    if unrolled:
+        plot.unroll(["bin %d" % i for i in range(config["unrolled_bins"])])
+    return plot
+
+
+def _run_stage(stage, config, paths, outdir):
+    import ROOT as R
+    import Dumbledraw.rootfile_parser as rootfile_parser
+    import Dumbledraw.rootfile_parser_ntuple_processor_inputshapes as ntuple_parser
+
+    R.gROOT.SetBatch(True)
+    timings = []
+    for i in range(config["repeat"]):
+        parser = None  # releases the file before the caches are reset
+        _reset_caches()
+        if stage == "open_index":
+            start = time.time()
+            parser = rootfile_parser.Rootfile_parser(paths["combine"])
+            timings.append(time.time() - start)
+            continue
+        if stage == "fetch_ntuple":
+            parser = ntuple_parser.Rootfile_parser(paths["ntuple"], _variable)
+            start = time.time()
+            for channel in _channels(config):
+                for category in _categories(config):
+                    parser.get_arrays(channel, _ntuple_processes, category)
+            timings.append(time.time() - start)
+            continue
+        parser = rootfile_parser.Rootfile_parser(paths["combine"])
+        if stage in ["fetch_cold", "fetch_warm"]:
+            if stage == "fetch_warm":
+                _fetch_all(parser, config)
+            start = time.time()
+            _fetch_all(parser, config)
+            timings.append(time.time() - start)
+            continue
+        if stage == "add_hist":
+            start = time.time()
+            plot = _booked_plot(parser, config)
+            timings.append(time.time() - start)
+        elif stage == "create_stack":
+            plot = _booked_plot(parser, config)
+            start = time.time()
+            plot.create_stack(_processes(config), "stack")
+            timings.append(time.time() - start)
+        elif stage == "draw_unrolled":
+            plot = _booked_plot(parser, config, unrolled=True)
+            plot.create_stack(_processes(config), "stack")
+            start = time.time()
+            for index in range(plot.nsubplots):
+                plot.subplot(index).Draw(["stack", "data_obs"])
+            timings.append(time.time() - start)
+        elif stage == "save":
+            plot = _booked_plot(parser, config)
+            plot.create_stack(_processes(config), "stack")
+            for index in range(plot.nsubplots):
+                plot.subplot(index).Draw(["stack", "data_obs"])
+            start = time.time()
+            plot.save(os.path.join(outdir, "plot_%d" % i), ["png", "pdf", "root"])
+            timings.append(time.time() - start)
+        plot.close()
+    # kilobytes on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    return stage, timings, peak_rss
+
+
+# sends the result of the stage to the parent process, None if the stage failed
+def _task(sender, args):
+    try:
+        result = _run_stage(*args)
+    except Exception:
+        logger.exception("Stage %s failed" % args[0])
+        result = None
+    sender.send(result)
+    sender.close()
+
+
+# runs the stage in a fresh process, so that the peak memory belongs to the stage.
+# Returns None if the stage failed, its process died (e.g. of a segmentation
+# violation) or did not finish within the timeout.
+def _run_in_process(context, args, timeout):
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_task, args=(sender, args))
+    process.start()
+    sender.close()  # the pipe is closed once the process ends
+    result = None
+    try:
+        if receiver.poll(timeout):
+            result = receiver.recv()
+        else:
+            logger.error("Stage %s did not finish within %s s" % (args[0], timeout))
+            process.terminate()
+    except EOFError:
+        pass
+    process.join()
+    if result is None and process.exitcode != 0:
+        logger.error("Stage %s exited with code %s" % (args[0], process.exitcode))
+    return result
+
+
+# the input files are named after the configuration they are generated with, so
+# that a workdir reused with another configuration does not benchmark stale files
+def input_paths(config, workdir):
+    suffix = "_".join(
+        "%s%d" % (key, config[key])
+        for key in ["channels", "categories", "processes", "systematics", "bins"]
+    )
+    return {
+        "combine": os.path.join(workdir, "combine_shapes_%s.root" % suffix),
+        "ntuple": os.path.join(workdir, "ntuple_shapes_%s.root" % suffix),
+    }
+
+
+def run(config, workdir, timeout=None):
+    paths = input_paths(config, workdir)
+    for name, generate in [
+        ("combine", generate_combine_file),
+        ("ntuple", generate_ntuple_file),
+    ]:
+        if not os.path.exists(paths[name]):
+            logger.info("Generating %s" % paths[name])
+            generate(paths[name], config)
+    outdir = os.path.join(workdir, "plots")
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    for stage in config["stages"]:
+        result = _run_in_process(context, (stage, config, paths, outdir), timeout)
+        if result is None:
+            results[stage] = {"failed": True}
+            logger.info("%-14s failed" % stage)
+            continue
+        stage, timings, peak_rss = result
+        results[stage] = {
+            "wall_time": timings,
+            "min": min(timings),
+            "median": sorted(timings)[len(timings) // 2],
+            "peak_rss_mb": peak_rss,
+        }
+        logger.info(
+            "%-14s median %8.4f s   min %8.4f s   peak RSS %8.1f MB"
+            % (stage, results[stage]["median"], results[stage]["min"], peak_rss)
+        )
+    return results
+
+
+def _commit():
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "HEAD"],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                stderr=subprocess.STDOUT,
+            )
+            .decode()
+            .strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# returns the stages whose median wall time or peak memory grew by more than the
+# threshold with respect to the baseline
+def compare(results, baseline, threshold):
+    regressions = []
+    logger.info("%-14s %12s %12s %12s" % ("stage", "time ratio", "RSS ratio", ""))
+    for stage, result in results["stages"].items():
+        if not stage in baseline["stages"] or result.get("failed"):
+            continue
+        reference = baseline["stages"][stage]
+        if reference.get("failed"):
+            continue
+        time_ratio = result["median"] / max(reference["median"], 1e-9)
+        rss_ratio = result["peak_rss_mb"] / max(reference["peak_rss_mb"], 1e-9)
+        regressed = time_ratio > 1.0 + threshold or rss_ratio > 1.0 + threshold
+        if regressed:
+            regressions.append(stage)
+        logger.info(
+            "%-14s %12.3f %12.3f %12s"
+            % (stage, time_ratio, rss_ratio, "REGRESSION" if regressed else "")
+        )
+    return regressions
+
+
+def main(args):
+    import ROOT as R
+
+    config = {
+        "channels": args.channels,
+        "categories": args.categories,
+        "processes": args.processes,
+        "systematics": args.systematics,
+        "bins": args.bins,
+        "unrolled_bins": args.unrolled_bins,
+        "repeat": args.repeat,
+        "stages": args.stages,
+    }
+    workdir = args.workdir if args.workdir is not None else tempfile.mkdtemp()
+    if not os.path.isdir(workdir):
+        os.makedirs(workdir)
+    try:
+        results = {
+            "meta": {
+                "commit": _commit(),
+                "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "python": platform.python_version(),
+                "root": R.gROOT.GetVersion(),
+                "host": platform.node(),
+                "config": config,
+            },
+            "stages": run(config, workdir, args.timeout),
+        }
+    finally:
+        # only a workdir given by the user is kept to reuse the input files
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+    with open(args.output, "w") as output_file:
+        json.dump(results, output_file, indent=2)
+    logger.info("Wrote results to %s" % args.output)
+    failed = [
+        stage for stage, result in results["stages"].items() if "failed" in result
+    ]
+    if failed:
+        logger.error("Failed stages %s" % ", ".join(failed))
+    if args.compare is not None:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline["meta"]["config"] != config:
+            logger.warning("The baseline was recorded with a different configuration!")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            logger.error("Regressions in %s" % ", ".join(regressions))
+            return 1
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    setup_logging()
+    sys.exit(main(args))
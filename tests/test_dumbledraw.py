@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import pytest
+
+R = pytest.importorskip("ROOT")
+
+import Dumbledraw.dumbledraw as dd
+
+
+def make_hist(name, scale=1.0):
+    hist = R.TH1F(name, name, 6, 0.0, 6.0)
+    for i in range(1, 7):
+        hist.SetBinContent(i, scale * i)
+        hist.SetBinError(i, 0.1 * i)
+    return hist
+
+
+# fills and draws a plot with a stack, a ratio, a legend and the CMS and lumi texts
+def draw(plot):
+    plot.add_hist(make_hist("a"), "a", "bkg")
+    plot.add_hist(make_hist("b", 2.0), "b", "bkg")
+    plot.add_hist(make_hist("data", 3.0), "data")
+    plot.setGraphStyle("a", "hist", fillcolor=2)
+    plot.setGraphStyle("b", "hist", fillcolor=3)
+    plot.subplot(1).normalize(["bkg", "data"], "bkg")
+    plot.create_stack(["a", "b"], "stack")
+    plot.subplot(0).Draw(["stack", "data"])
+    plot.subplot(1).Draw(["bkg", "data"])
+    plot.add_legend(width=0.3, height=0.2)
+    plot.legend(0).add_entry(0, "data", "Data", "PE")
+    plot.legend(0).Draw()
+    plot.DrawCMS()
+    plot.DrawLumi("59.7 fb^{-1}")
+
+
+def test_plot_close(tmp_path):
+    plot = dd.Plot([0.5], "none")
+    draw(plot)
+    plot.save(str(tmp_path / "plot.png"))
+    plot.close()
+    assert (tmp_path / "plot.png").stat().st_size > 0
+    plot.close()  # closing twice does nothing
+
+
+def test_empty_plot_close():
+    with dd.Plot([0.5], "none"):
+        pass
+
+
+def test_template_reuses_canvas(tmp_path):
+    template = dd.PlotTemplate([0.5], "none")
+    canvas = None
+    for i in range(3):
+        plot = template.new_plot()
+        if canvas is None:
+            canvas = plot._canvas
+        assert plot._canvas is canvas
+        assert plot.nsubplots == 2
+        assert plot.subplot(0).hists == {}
+        plot.add_inlet(dd.InletPlot("inlet_%d" % i, 0.6, 0.9, 0.6, 0.9))
+        draw(plot)
+        plot.save(str(tmp_path / ("plot_%d.png" % i)))
+    template.close()
+    # every plot is drawn like the first one on a fresh canvas
+    contents = [(tmp_path / ("plot_%d.png" % i)).read_bytes() for i in range(3)]
+    assert contents[1] == contents[0]
+    assert contents[2] == contents[0]
+
+
+def test_add_band(tmp_path):
+    with dd.Plot([0.5], "none") as plot:
+        plot.add_hist(make_hist("nominal"), "nominal")
+        plot.add_hist(make_hist("up", 1.1), "up")
+        plot.add_band("stat", "nominal", kind="stat")
+        plot.add_band("total", "nominal", "up", kind="total", ratio_subplots=[1])
+        main = plot.subplot(0).get_graph("total").obj
+        ratio = plot.subplot(1).get_graph("total").obj
+        # the band of the ratio subplot is divided by the nominal values
+        assert ratio.GetPointY(2) == pytest.approx(1.0)
+        assert ratio.GetErrorYhigh(2) == pytest.approx(main.GetErrorYhigh(2) / 3.0)
+        plot.subplot(0).Draw(["nominal", "stat", "total"])
+        plot.subplot(1).Draw(["total"])
+        plot.save(str(tmp_path / "band.png"))
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+R = pytest.importorskip("ROOT")
+
+from Dumbledraw import hist_arrays
+
+
+def bins(hist):
+    return [hist.GetBinContent(i) for i in range(hist.GetNcells())]
+
+
+def errors(hist):
+    return [hist.GetBinError(i) for i in range(hist.GetNcells())]
+
+
+@pytest.mark.parametrize("hist_class", ["TH1C", "TH1S", "TH1I", "TH1F", "TH1D"])
+def test_divide_like_root(hist_class):
+    edges = np.array([0.0, 1.0, 3.0, 6.0])
+    hist = getattr(R, hist_class)("divide_" + hist_class, "", 3, edges)
+    for i, content in enumerate([5.0, 8.0, 12.0], start=1):
+        hist.SetBinContent(i, content)
+    expected = hist.Clone("expected_" + hist_class)
+    expected.Scale(0.5)
+
+    hist_arrays.divide([hist], np.array([1.0, 2.0, 2.0, 2.0, 0.0]))
+    assert bins(hist) == bins(expected)
+    assert errors(hist) == pytest.approx(errors(expected))
+
+    expected.Scale(1.0, "width")
+    hist_arrays.divide_by_bin_width([hist])
+    assert bins(hist) == bins(expected)
+    assert errors(hist) == pytest.approx(errors(expected))
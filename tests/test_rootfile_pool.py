@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+
+import pytest
+
+R = pytest.importorskip("ROOT")
+
+from Dumbledraw.rootfile_pool import Rootfile_pool
+
+
+@pytest.fixture
+def rootfile(tmp_path):
+    path = str(tmp_path / "shapes.root")
+    output = R.TFile(path, "RECREATE")
+    output.Close()
+    return path
+
+
+def test_release_after_close_all(rootfile, caplog):
+    pool = Rootfile_pool()
+    pool.acquire(rootfile)
+    pool.close_all()
+    assert len(pool) == 0
+    with caplog.at_level(logging.WARNING):
+        pool.release(rootfile)
+    assert caplog.records == []
+
+
+def test_release_unused(rootfile, caplog):
+    pool = Rootfile_pool()
+    pool.acquire(rootfile)
+    pool.release(rootfile)
+    with caplog.at_level(logging.WARNING):
+        pool.release(rootfile)
+    assert "not in use" in caplog.text
+    pool.close_all()